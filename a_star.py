@@ -1,4 +1,7 @@
 import floor_plan
+import instrument
+import numpy as np
+import heapq
 import math
 import time
 
@@ -29,6 +32,11 @@ class Graph:
             self.graph_dict.setdefault(B, {})[A] = distance
             self.connected.append([B, A])
 
+    # Add links from every node in [sources] to the node of the same index in [targets]
+    def connect_many(self, sources, targets, distances):
+        for (A, B, distance) in zip(sources, targets, distances):
+            self.connect(A, B, distance)
+
     # Get neighbors or a neighbor
     def get(self, a, b=None):
         links = self.graph_dict.setdefault(a, {})
@@ -45,6 +53,183 @@ class Graph:
         return list(nodes)
 
 
+# This class represent a frozen graph. Node keys are mapped to dense integer ids and the adjacency is stored
+# in compressed sparse row (CSR) arrays: the neighbors of node i are indices[indptr[i]:indptr[i + 1]] with
+# distances weights[indptr[i]:indptr[i + 1]]
+class CompactGraph:
+
+    # Initialize the class
+    def __init__(self, keys, indptr, indices, weights):
+        self.keys = list(keys)
+        self.ids = {k: i for i, k in enumerate(self.keys)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        for a in (self.indptr, self.indices, self.weights):
+            a.setflags(write=False)
+        self.adjacency = None
+
+    # Creates a CompactGraph from parallel arrays of edge end ids and distances. Duplicate edges are dropped.
+    @classmethod
+    def from_edges(cls, keys, sources, targets, distances, directed=False):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        distances = np.asarray(distances, dtype=np.float64)
+        if not directed:
+            sources, targets = np.concatenate((sources, targets)), np.concatenate((targets, sources))
+            distances = np.concatenate((distances, distances))
+        size = len(keys)
+        # Sort the edges by source then target, and keep the first of each duplicate pair
+        order = np.lexsort((targets, sources))
+        sources, targets, distances = sources[order], targets[order], distances[order]
+        unique = np.ones(len(sources), dtype=bool)
+        unique[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, distances = sources[unique], targets[unique], distances[unique]
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+        return cls(keys, indptr, targets, distances)
+
+    # Creates a CompactGraph from a Graph object
+    @classmethod
+    def from_graph(cls, graph):
+        ids = {}
+        for a, links in graph.graph_dict.items():
+            ids.setdefault(a, len(ids))
+            for b in links.keys():
+                ids.setdefault(b, len(ids))
+        sources, targets, distances = [], [], []
+        for a, links in graph.graph_dict.items():
+            for b, dist in links.items():
+                sources.append(ids[a])
+                targets.append(ids[b])
+                distances.append(dist)
+        return cls.from_edges(list(ids.keys()), sources, targets, distances, directed=True)
+
+    # Only the keys and arrays are pickled. The id map and adjacency lists are rebuilt
+    def __getstate__(self):
+        return {'keys': self.keys, 'indptr': self.indptr, 'indices': self.indices, 'weights': self.weights}
+
+    def __setstate__(self, state):
+        self.__init__(state['keys'], state['indptr'], state['indices'], state['weights'])
+
+    # Returns the integer id of a node key
+    def node_id(self, key):
+        return self.ids[key]
+
+    # Returns the node key of an integer id
+    def node_key(self, i):
+        return self.keys[i]
+
+    # Returns the number of nodes in the graph
+    def number_of_nodes(self):
+        return len(self.keys)
+
+    # Returns the number of directed edges in the graph
+    def number_of_edges(self):
+        return len(self.indices)
+
+    # Returns the memory used by the adjacency arrays in bytes
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.weights.nbytes
+
+    # Returns the neighbor ids and distances of node id i
+    def neighbors(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    # Get neighbors or a neighbor. Same as Graph.get, but does not create missing nodes
+    def get(self, a, b=None):
+        i = self.ids.get(a)
+        if i is None:
+            links = {}
+        else:
+            idx, dist = self.neighbors(i)
+            links = {self.keys[j]: d for j, d in zip(idx.tolist(), dist.tolist())}
+        if b is None:
+            return links
+        else:
+            return links.get(b)
+
+    # Return a list of nodes in the graph
+    def nodes(self):
+        return list(self.keys)
+
+    # Returns list of connections in the graph, in the same form as Graph.connected but without duplicates
+    def connections(self):
+        sources = np.repeat(np.arange(len(self.keys)), np.diff(self.indptr))
+        return [[self.keys[a], self.keys[b]] for a, b in zip(sources.tolist(), self.indices.tolist())]
+
+    # Returns adjacency lists of (neighbor id, distance) pairs. Built once, used by the traversals
+    def adjacency_lists(self):
+        if self.adjacency is None:
+            indptr = self.indptr.tolist()
+            indices = self.indices.tolist()
+            weights = self.weights.tolist()
+            self.adjacency = [list(zip(indices[indptr[i]:indptr[i + 1]], weights[indptr[i]:indptr[i + 1]]))
+                              for i in range(len(self.keys))]
+        return self.adjacency
+
+    # Dijkstra search from node id source. Returns arrays of distances (inf if unreachable) and predecessor ids
+    # (-1 for the source and unreachable nodes). Nodes further than [cutoff] are left unreached
+    def shortest_path_tree(self, source, cutoff=math.inf):
+        adjacency = self.adjacency_lists()
+        distances = [math.inf] * len(self.keys)
+        predecessors = [-1] * len(self.keys)
+        closed = [False] * len(self.keys)
+        distances[source] = 0
+        open_heap = [(0, source)]
+        while open_heap:
+            g, i = heapq.heappop(open_heap)
+            if closed[i]:
+                continue
+            closed[i] = True
+            for j, dist in adjacency[i]:
+                neighbor_g = g + dist
+                if neighbor_g < distances[j] and neighbor_g <= cutoff:
+                    distances[j] = neighbor_g
+                    predecessors[j] = i
+                    heapq.heappush(open_heap, (neighbor_g, j))
+        if instrument.enabled():
+            instrument.count('dijkstra_nodes_expanded', closed.count(True))
+        return np.array(distances), np.array(predecessors, dtype=np.int64)
+
+
+# This class collects nodes and edges with the same connect interface as Graph, and builds a CompactGraph
+class GraphBuilder:
+
+    # Initialize the class
+    def __init__(self):
+        self.ids = {}
+        self.sources = []
+        self.targets = []
+        self.distances = []
+
+    # Adds nodes to the builder. Returns the integer ids of the nodes
+    def add_nodes(self, keys):
+        return np.array([self.ids.setdefault(k, len(self.ids)) for k in keys], dtype=np.int64)
+
+    # Add a link from A and B of given distance
+    def connect(self, A, B, distance=1):
+        self.connect_ids(self.add_nodes([A]), self.add_nodes([B]), [distance])
+
+    # Add links from every node in [sources] to the node of the same index in [targets]
+    def connect_many(self, sources, targets, distances):
+        self.connect_ids(self.add_nodes(sources), self.add_nodes(targets), distances)
+
+    # Add links between arrays of integer node ids returned by add_nodes
+    def connect_ids(self, sources, targets, distances):
+        self.sources.append(np.asarray(sources, dtype=np.int64))
+        self.targets.append(np.asarray(targets, dtype=np.int64))
+        self.distances.append(np.asarray(distances, dtype=np.float64))
+
+    # Returns a CompactGraph with all the nodes and links added so far
+    def build(self, directed=False):
+        if not self.sources:
+            return CompactGraph.from_edges(list(self.ids.keys()), [], [], [], directed)
+        return CompactGraph.from_edges(list(self.ids.keys()), np.concatenate(self.sources),
+                                       np.concatenate(self.targets), np.concatenate(self.distances), directed)
+
+
 # This class represent a node
 class Node:
 
@@ -92,6 +277,7 @@ def astar_search(graph, heuristics, start, end):
 
         # Check if we have reached the goal, return the path
         if current_node == goal_node:
+            instrument.count('astar_nodes_expanded', len(closed))
             path = []
             while current_node != start_node:
                 path.append([current_node.name, current_node.g])
@@ -124,6 +310,7 @@ def astar_search(graph, heuristics, start, end):
                 open.append(neighbor)
 
     # Return None, no path is found
+    instrument.count('astar_nodes_expanded', len(closed))
     return None
 
 
@@ -134,3 +321,105 @@ def add_to_open(open, neighbor):
             return False
     return True
 
+
+# A* search on a binary heap. Returns the same path format as astar_search.
+def heap_astar_search(graph, heuristics, start, end):
+    # Heap entries are (f, tie breaker, g, name). Stale entries are skipped when popped (lazy deletion)
+    open_heap = [(heuristics.get(start, 0), 0, 0, start)]
+    closed = set()
+    best_g = {start: 0}
+    parents = {start: None}
+    counter = 1
+
+    # Loop until the open heap is empty
+    while open_heap:
+
+        # Get the node with the lowest cost
+        f, _, g, name = heapq.heappop(open_heap)
+        if name in closed:
+            continue
+
+        # Add the current node to the closed set
+        closed.add(name)
+
+        # Check if we have reached the goal, return the path
+        if name == end:
+            instrument.count('astar_nodes_expanded', len(closed))
+            path = []
+            while name is not None:
+                path.append([name, best_g[name]])
+                name = parents[name]
+            # Return reversed path
+            return path[::-1]
+
+        # Loop neighbors
+        for key, value in graph.get(name).items():
+            if key in closed:
+                continue
+
+            # Only push the neighbor if this is the cheapest way found to reach it
+            neighbor_g = g + value
+            if neighbor_g >= best_g.get(key, math.inf):
+                continue
+            best_g[key] = neighbor_g
+            parents[key] = name
+            heapq.heappush(open_heap, (neighbor_g + heuristics.get(key, 0), counter, neighbor_g, key))
+            counter = counter + 1
+
+    # Return None, no path is found
+    instrument.count('astar_nodes_expanded', len(closed))
+    return None
+
+
+# Dijkstra search from a single source. Returns the distance and the predecessor of every reachable node.
+def shortest_path_tree(graph, source):
+    if isinstance(graph, CompactGraph):
+        if source not in graph.ids:
+            return {source: 0}, {source: None}
+        dist, pred = graph.shortest_path_tree(graph.node_id(source))
+        reached = np.flatnonzero(np.isfinite(dist)).tolist()
+        dist, pred = dist.tolist(), pred.tolist()
+        distances = {graph.keys[i]: dist[i] for i in reached}
+        predecessors = {graph.keys[i]: graph.keys[pred[i]] if pred[i] >= 0 else None for i in reached}
+        return distances, predecessors
+    distances = {source: 0}
+    predecessors = {source: None}
+    closed = set()
+    open_heap = [(0, 0, source)]
+    counter = 1
+
+    # Loop until the open heap is empty
+    while open_heap:
+        g, _, name = heapq.heappop(open_heap)
+        if name in closed:
+            continue
+        closed.add(name)
+
+        # Relax every neighbor of the current node
+        for key, value in graph.get(name).items():
+            if key in closed:
+                continue
+            neighbor_g = g + value
+            if neighbor_g >= distances.get(key, math.inf):
+                continue
+            distances[key] = neighbor_g
+            predecessors[key] = name
+            heapq.heappush(open_heap, (neighbor_g, counter, key))
+            counter = counter + 1
+
+    instrument.count('dijkstra_nodes_expanded', len(closed))
+    return distances, predecessors
+
+
+# Rebuilds the path from start to the source of a shortest path tree in the format of astar_search.
+# The graph must be undirected for the path to be valid in this direction.
+def tree_path(distances, predecessors, start):
+    if start not in distances:
+        return None
+    total = distances[start]
+    path = []
+    name = start
+    while name is not None:
+        path.append([name, total - distances[name]])
+        name = predecessors[name]
+    return path
@@ -1,11 +1,11 @@
 import matplotlib.pyplot as plt
 import matplotlib.colors as clr
-import matplotlib.path as mpltPath
 import api_manager
 import create_graph
-import random
-import math
-import coordinate_plane as c_plane
+import a_star
+import parallel
+import visibility
+import instrument
 from constants import *
 
 # Color bar for continuous color coding rather than discrete.
@@ -119,8 +119,9 @@ def human_movement_organize(floor):
              [room_door] = A dictionary showing connections between rooms and doors.
              [room_chair] = A dictionary showing connections between rooms and chairs.
              [fake_mesh] = A list tuples where each tuple is a fake mesh id.
+             [mesh] = A Mesh object (mesh.py) of the floor mesh with the door and chair points.
     """
-    graph, connected, chair_ids, door_connected, fake_mesh = create_graph.create_analysis(floor)
+    graph, connected, chair_ids, door_connected, fake_mesh, mesh = create_graph.create_analysis(floor, compact=True)
     room_door = {}
     room_chair = {}
     room_num = 0
@@ -141,21 +142,21 @@ def human_movement_organize(floor):
         room_door[room_num] = door_inside
         room_chair[room_num] = chair_inside
         room_num = room_num + 1
-    return graph, chair_ids, room_door, room_chair, fake_mesh
+    return graph, chair_ids, room_door, room_chair, fake_mesh, mesh
 
 
 def fake_mesh_helper(mesh_dict, i, x, y, occurrence):
     """
     Assigns values to the "fake" points before plotting them on the floor plan.
     Serves as a helper function
-    :param mesh_dict: A dictionary of mesh id keys and mesh coordinate values.
+    :param mesh_dict: A dictionary or set of the mesh ids that may be used.
     :param i: An integer representing a room number id
     :param x: An integer representing x id of fake point
     :param y: An integer representing y id of fake point
     :param occurrence: A dictionary showing mesh id keys and number of occurrences values
     :return: A float representing occurrence value to be given to fake node
     """
-    m_key = list(mesh_dict.keys())
+    m_key = mesh_dict
     num = 0
     total = 0
 
@@ -187,54 +188,75 @@ def fake_mesh_helper(mesh_dict, i, x, y, occurrence):
     return total / num
 
 
-def human_movement(floor):
+def movement_counts(payload):
     """
-    Displays which areas of the floor plan has more human movement. The human movement density is
-    calculated by counting how many different shortest paths (door to door, door to chair) cross a node
-    Color legend: Red - not a lot of human movement, yellow - decent human movement, green - a lot of human movement
-    :param floor: A FloorPlan object (floor_plan.py)
-    :return: None
+    Counts how many shortest paths (door to door, chair to door) cross every node, for a group of rooms.
+    Serves as a helper function for human_movement and can run in a worker process.
+    :param payload: Tuple of a Graph or CompactGraph object (a_star.py) and a list of (door_list, chair_list) of
+            each room in the group
+    :return: [occurrence] = Dictionary of node ids and how many paths cross them
     """
-    node_list = []
-    mesh_dict = floor.collect_mesh()
-    graph, chair_ids, room_door, room_chair, fake_mesh = human_movement_organize(floor)
-    occurrence = {i: 0 for i in floor.get_id_list()}
-
-    # Parse through every room.
-    for r in room_door.keys():
-        door_list = room_door[r]
-        chair_list = room_chair[r]
+    graph, rooms = payload
+    occurrence = {}
+    for (door_list, chair_list) in rooms:
         for i in range(len(door_list)):
             goal = door_list[i]
 
-            # Initialize heuristics to None for every new goal node
-            heuristics = None
+            # One shortest path tree from the goal door gives the paths of every start point
+            distances, predecessors = a_star.shortest_path_tree(graph, goal)
 
             # Door to door connections (of same room)
             for j in range(i + 1, len(door_list)):
                 start = door_list[j]
-                path, heuristics = create_graph.shortest_path(graph, floor, start, goal, heuristics)
+                path = a_star.tree_path(distances, predecessors, start)
                 if path is None:
                     continue
                 for p in range(1, len(path) - 1):
-                    occurrence[path[p][0]] = occurrence[path[p][0]] + 1
+                    occurrence[path[p][0]] = occurrence.get(path[p][0], 0) + 1
 
             # Chair to door connections (of same room)
             for c in chair_list:
-                path, heuristics = create_graph.shortest_path(graph, floor, c, goal, heuristics)
+                path = a_star.tree_path(distances, predecessors, c)
                 if path is None:
                     continue
                 for p in range(1, len(path) - 1):
-                    occurrence[path[p][0]] = occurrence[path[p][0]] + 0.25
+                    occurrence[path[p][0]] = occurrence.get(path[p][0], 0) + 0.25
+    return occurrence
+
+
+def human_movement(floor, workers=WORKERS, progress=None):
+    """
+    Displays which areas of the floor plan has more human movement. The human movement density is
+    calculated by counting how many different shortest paths (door to door, door to chair) cross a node
+    Color legend: Red - not a lot of human movement, yellow - decent human movement, green - a lot of human movement
+    :param floor: A FloorPlan object (floor_plan.py)
+    :param workers: Number of worker processes the rooms are split between
+    :param progress: Function called with (finished, total) number of room groups whenever a group is finished
+    :return: None
+    """
+    node_list = []
+    graph, chair_ids, room_door, room_chair, fake_mesh, mesh = human_movement_organize(floor)
+    occurrence = {i: 0 for i in mesh.keys()}
+
+    # Parse through every room. Each worker gets the graph once with its group of rooms. In this process every room
+    # is a group of its own, so progress is reported per room
+    rooms = [(room_door[r], room_chair[r]) for r in room_door.keys()]
+    groups = parallel.split(rooms, workers if workers is not None and workers > 1 else len(rooms))
+    payloads = [(graph, group) for group in groups]
+    for counts in parallel.map_rooms(movement_counts, payloads, workers, progress):
+        for k, v in counts.items():
+            occurrence[k] = occurrence[k] + v
 
     # Calls fake mesh helper function to assign values to every existing fake node.
+    # Fake nodes that already have a value count as neighbors of the later fake nodes
+    m_key = set(mesh.keys())
     for (i, x, y) in fake_mesh.keys():
-        occ_val = fake_mesh_helper(mesh_dict, i, x, y, occurrence)
+        occ_val = fake_mesh_helper(m_key, i, x, y, occurrence)
         occurrence[(i, x, y)] = occ_val
-        floor.add_merged_dict((i, x, y), fake_mesh[(i, x, y)])
+        m_key.add((i, x, y))
 
     maximum_val = max(list(occurrence.values()))
-    mesh_dict = floor.get_mesh_dict()
+    mesh_dict = mesh.with_points(fake_mesh)
     for k in mesh_dict.keys():
         node_list.append({'position': {'x': mesh_dict[k][0],
                                        'z': mesh_dict[k][1]},
@@ -242,130 +264,7 @@ def human_movement(floor):
     return {'nodes': node_list}
 
 
-def view_helper(corners, p, p1, p2, mid_point, counter):
-    """
-    Recursive helper function for view_helper
-    :param corners: list of corners of the room
-    :param p: Point object that represents the view point
-    :param p1: Point object that represents the current viewpoint segment
-    :param p2: Point object that represents the current viewpoint segment
-    :param mid_point: Point object that represents the mid_point between p1 and p2
-    :param counter: An integer that represents the current run through number
-    :return: [mid_point] - Point object
-    """
-    if counter <= 0:
-        return mid_point
-    if c_plane.do_intersect_exclude_on_segment(corners, p, mid_point):
-        mid_p = c_plane.Point((mid_point.x + p2.x) / 2, (mid_point.y + p2.y) / 2)
-        return view_helper(corners, p, mid_point, p2, mid_p, counter - 1)
-    else:
-        mid_p = c_plane.Point((p1.x + mid_point.x) / 2, (p1.y + mid_point.y) / 2)
-        return view_helper(corners, p, p1, mid_point, mid_p, counter - 1)
-
-
-def view_main_loop(p, corners):
-    """
-    Main loop the field of view function runs to find the view area polygon
-    :param p: Point object that represents view point
-    :param corners: list of corners of the room
-    :return: [view_list] - list of coordinates corresponding to corners of the view area polygon
-    """
-    view_list = []
-    for i in range(len(corners)):
-        (first_x, first_y), (second_x, second_y) = corners[i], corners[(i + 1) % len(corners)]
-        p1 = c_plane.Point(first_x, first_y)
-        p2 = c_plane.Point(second_x, second_y)
-        if c_plane.do_intersect_exclude_on_segment(corners, p, p1):
-            if c_plane.do_intersect_exclude_on_segment(corners, p, p2):
-                p1_new = view_helper(corners, p, p1, p2, p1, REC_COUNT)
-                p2_new = view_helper(corners, p, p2, p1, p2, REC_COUNT)
-                if -10 < p1_new.x - p2.x < 10 and -10 < p1_new.y - p2.y < 10 and -10 < p2_new.x - p1.x < 10 and -10 < p2_new.y - p1.y < 10:
-                    continue
-                elif -10 < p1_new.x - p2.x < 10 and -10 < p1_new.y - p2.y < 10:
-                    p1_new = view_helper(corners, p, p1, p2_new, p1, REC_COUNT)
-                    view_list = view_list + [p1_new, p2_new]
-                elif -10 < p2_new.x - p1.x < 10 and -10 < p2_new.y - p1.y < 10:
-                    p2_new = view_helper(corners, p, p2, p1_new, p2, REC_COUNT)
-                    view_list = view_list + [p1_new, p2_new]
-                else:
-                    view_list = view_list + [p1_new, p2_new]
-            else:
-                p_new = view_helper(corners, p, p1, p2, p1, REC_COUNT)
-                view_list = view_list + [p_new]
-        else:
-            if c_plane.do_intersect_exclude_on_segment(corners, p, p2):
-                p_new = view_helper(corners, p, p2, p1, p2, REC_COUNT)
-                view_list = view_list + [p1, p_new]
-            else:
-                view_list = view_list + [p1]
-    return view_list
-
-
-def column_helper(column, p, view_list):
-    """
-    Helper function for the field of view function. Takes the view area polygon and updates it while taking
-    obstacles such as columns and walls into account.
-    :param column: column item object or a rogue wall inside the room
-    :param p: Point object that represents the view point
-    :param view_list: list of coordinates that correspond to the corners of the view area polygon
-    :return: [view_list_new] - list of coordinates that correspond to the corners of the view area polygon
-    """
-    view_list_new = []
-    color = (random.random(), random.random(), random.random())
-    for i in range(len(view_list)):
-        p1, p2 = view_list[i], view_list[(i + 1) % len(view_list)]
-        path = mpltPath.Path([(p.x, p.y), (p1.x, p1.y), (p2.x, p2.y)])
-        current = []
-        corners_new = {}
-        for (cx, cy) in column:
-            # Checks that corner is in current segment
-            if not path.contains_points([(cx, cy)]):
-                continue
-            c_point = c_plane.Point(cx, cy)
-            # Checks that current viewpoint to corner segment intersects itself
-            if c_plane.do_intersect_exclude_on_segment(column, p, c_point):
-                continue
-            intersection = c_plane.find_intersection(p, c_point, p1, p2)
-            dist = math.sqrt((intersection.x - p1.x) ** 2 + (intersection.y - p1.y) ** 2)
-            # Checks for middle corner point
-            c_index = column.index((cx, cy))
-            column_copy = column.copy()
-            column_copy.pop(c_index)
-            if c_plane.do_intersect_exclude_on_segment(column_copy, p, intersection):
-                corners_new[dist] = (None, c_point)
-                continue
-            # Non middle corner point
-            corners_new[dist] = (intersection, c_point)
-        # Check p1 does not intersect column
-        if not c_plane.do_intersect_exclude_on_segment(column, p, p1):
-            current.append(p1)
-            checked = False
-        else:
-            checked = True
-        # Sort distance
-        distance_sorted = sorted(list(corners_new.keys()))
-        # Append by distance
-        for d in distance_sorted:
-            points = corners_new[d]
-            if points[0] is None:
-                current.append(points[1])
-                checked = True
-                continue
-            if checked:
-                current = current + [points[1], points[0]]
-                checked = False
-            else:
-                current = current + [points[0], points[1]]
-                checked = True
-        # Check p2 does not intersect column
-        if not c_plane.do_intersect_exclude_on_segment(column, p, p2):
-            current.append(p2)
-        for i in range(len(current)):
-            first, second = current[i], current[(i + 1) % len(current)]
-            view_list_new.append(first)
-    return view_list_new
-
-
+@instrument.timed('point_view')
 def point_view(room, x, y, obstacles, original):
     """
     Finds the view area polygon of the room considering its view point and the columns/wall inside the room that
@@ -379,37 +278,50 @@ def point_view(room, x, y, obstacles, original):
     :return: [view_dict] - list of dictionaries where each dictionary holds information about the coordinates of
             the view polygon
     """
-    inner_points = room.room_polygon()
-    p = c_plane.Point(x, y)
-    view_dict = []
-    view_list = view_main_loop(p, inner_points)
-    ordered = sorted(list(obstacles.keys()), key=lambda i: (i[0]-x)**2 + (i[1] - y)**2, reverse=True)
-    for c in ordered:
-        current = obstacles[c][0:4]
-        view_list = column_helper(current, p, view_list)
+    segments = visibility.view_segments(room.room_polygon(), [obstacles[c][0:4] for c in obstacles.keys()])
+    view_list = visibility.visibility_polygon(x, y, segments)
     if original:
-        for p in view_list:
-            view_dict.append({"x": p.x, "z": p.y})
-        return view_dict
+        return [{"x": px, "z": py} for (px, py) in view_list]
     else:
-        for p in view_list:
-            view_dict.append((p.x, p.y))
-        return view_dict
+        return view_list
+
+
+def room_obstacles(floor, room):
+    """
+    Collects the obstacles that block vision inside a room: columns and rogue walls starting inside the room.
+    :param floor: A FloorPlan object (floor_plan.py)
+    :param room: A Room object of the floor plan (floor_plan.py)
+    :return: [column_dict] - Dictionary of obstacle positions and their list of corners
+    """
+    column_dict = room.column_items()
+    walls = floor.rogue_wall()
+    for w in walls:
+        start_corner = api_manager.corner_by_id(w.get_start(), floor.get_corners())
+        end_corner = api_manager.corner_by_id(w.get_end(), floor.get_corners())
+        if room.point_is_inside(start_corner.x_pos(), start_corner.z_pos()):
+            column_dict[(start_corner.x_pos(), start_corner.z_pos())] = [(start_corner.x_pos(), start_corner.z_pos()), (end_corner.x_pos(), end_corner.z_pos())]
+    return column_dict
 
 
 def point_view_all(floor, x, y):
     for r in floor.rooms:
         if r.point_is_inside(x, y):
-            column_dict = r.column_items()
-            walls = floor.rogue_wall()
-            for w in walls:
-                start_corner = api_manager.corner_by_id(w.get_start(), floor.get_corners())
-                end_corner = api_manager.corner_by_id(w.get_end(), floor.get_corners())
-                if r.point_is_inside(start_corner.x_pos(), start_corner.z_pos()):
-                    column_dict[(start_corner.x_pos(), start_corner.z_pos())] = [(start_corner.x_pos(), start_corner.z_pos()), (end_corner.x_pos(), end_corner.z_pos())]
+            column_dict = room_obstacles(floor, r)
             return {"polygon_points": point_view(r, x, y, column_dict, True)}
 
 
+def privacy_counts(payload):
+    """
+    Counts how often every mesh point of a room can be viewed from the other mesh points.
+    Serves as a helper function for privacy and can run in a worker process.
+    :param payload: Tuple of the room polygon, list of obstacle corners and array of mesh coordinates
+    :return: [counts] - List of view counts in the order of the mesh coordinates
+    """
+    room_polygon, obstacles, coordinates = payload
+    segments = visibility.view_segments(room_polygon, obstacles)
+    return visibility.visibility_counts(coordinates, segments).tolist()
+
+
 def privacy(room, obstacles):
     """
     Returns information on which parts of the floor plan are more private compared to other locations.
@@ -419,32 +331,26 @@ def privacy(room, obstacles):
             the floor plan
     """
     mesh = room.get_mesh_dict()
-    occurrence = {i: 0 for i in room.get_id_list()}
-    for i in mesh.keys():
-        x, y = mesh[i][0], mesh[i][1]
-        view_poly = mpltPath.Path(point_view(room, x, y, obstacles, False))
-        for j in mesh.keys():
-            if view_poly.contains_point(mesh[j]):
-                occurrence[j] += 1
-    return occurrence
+    counts = privacy_counts((room.room_polygon(), [obstacles[c][0:4] for c in obstacles.keys()],
+                             mesh.grid_coordinates()))
+    return dict(zip(mesh.keys(), counts))
 
 
-def privacy_all(floor):
+# Privacy of every mesh point of the floor plan. [progress] is called with (finished, total) number of rooms whenever
+# a room is finished
+def privacy_all(floor, workers=WORKERS, progress=None):
     occurrence = {}
     node_list = []
+    payloads = []
     for r in floor.rooms:
-        r.update_mesh()
-        column_dict = r.column_items()
-        walls = floor.rogue_wall()
-        for w in walls:
-            start_corner = api_manager.corner_by_id(w.get_start(), floor.get_corners())
-            end_corner = api_manager.corner_by_id(w.get_end(), floor.get_corners())
-            if r.point_is_inside(start_corner.x_pos(), start_corner.z_pos()):
-                column_dict[(start_corner.x_pos(), start_corner.z_pos())] = [(start_corner.x_pos(), start_corner.z_pos()), (end_corner.x_pos(), end_corner.z_pos())]
-        room_view = privacy(r, column_dict)
+        column_dict = room_obstacles(floor, r)
+        payloads.append((r.room_polygon(), [column_dict[c][0:4] for c in column_dict.keys()],
+                         r.get_mesh_dict().grid_coordinates()))
+    room_views = parallel.map_rooms(privacy_counts, payloads, workers, progress)
+    for r, room_view in zip(floor.rooms, room_views):
         r_mesh = r.get_mesh_dict()
-        for i in r_mesh.keys():
-            occurrence[r_mesh[i]] = room_view[i]
+        for coord, count in zip(r_mesh.values(), room_view):
+            occurrence[coord] = count
     maximum_val = max(list(occurrence.values()))
     for (x, y) in occurrence.keys():
         node_list.append({'position': {'x': x, 'z': y}, 'value': occurrence[(x, y)] / maximum_val})
@@ -1,21 +1,95 @@
+from collections import OrderedDict
 import requests
-from item import Item
+from item import ItemBatch
 from floor_plan import Room, Corner, Wall, FloorPlan
+from plan_cache import PlanCache, FloorCache
+from constants import CACHE_SIZE, CACHE_TTL, CACHE_DIR, FLOOR_CACHE_SIZE, API_URL, PROJECT_DIR, PROJECT_LATENCY
 import matplotlib.pyplot as plt
 import analysis
 import corona
+import instrument
+import json
 import time
+import os
+import re
 
+# Port ids that can name a recorded project file, so a port id cannot reach outside the directory
+PLAIN_PORT_ID = re.compile(r'[A-Za-z0-9_-]+')
 
-def get_floor_plan(port_id):
+
+@instrument.timed('fetch_project')
+def fetch_project(port_id):
+    """
+    Fetches project json from the Archisketch API, or from the recorded projects in PROJECT_DIR if it is set
+    :param port_id: A string that represents Archi id of floor plan
+    :return: [project] = json of project
+    """
+    if PROJECT_DIR is not None:
+        return load_project(port_id, PROJECT_DIR, PROJECT_LATENCY)
+    response = requests.get(API_URL + port_id + '/detail')
+    return response.json()['project']
+
+
+def load_project(port_id, directory, latency=0):
+    """
+    Loads a recorded project json from <directory>/<port_id>.json, which holds either the response of the Archisketch
+    API or the project itself
+    :param port_id: A string that represents Archi id of floor plan
+    :param directory: Directory of the recorded projects
+    :param latency: Seconds to wait before returning a loaded project, to stand in for the Archisketch API
+    :return: [project] = json of project
+    """
+    with open(project_path(port_id, directory)) as f:
+        project = json.load(f)
+    time.sleep(latency)
+    return project.get('project', project)
+
+
+def project_path(port_id, directory):
+    """
+    Returns the path of the recorded project of a port id. Raises ValueError for port ids that are not plain
+    letters, digits, '-' and '_', such as ones with '..' or path separators
+    :param port_id: A string that represents Archi id of floor plan
+    :param directory: Directory of the recorded projects
+    :return: [path] = Path of <directory>/<port_id>.json
+    """
+    if PLAIN_PORT_ID.fullmatch(port_id) is None:
+        raise ValueError('Invalid port id: ' + repr(port_id))
+    return os.path.join(directory, port_id + '.json')
+
+
+def record_project(port_id, directory):
+    """
+    Fetches project json from the Archisketch API and writes it to <directory>/<port_id>.json, to be loaded later
+    with PROJECT_DIR
+    :param port_id: A string that represents Archi id of floor plan
+    :param directory: Directory of the recorded projects
+    :return: [path] = Path of the recorded file
+    """
+    path = project_path(port_id, directory)
+    response = requests.get(API_URL + port_id + '/detail')
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(response.json(), f)
+    return path
+
+
+# Cache of fetched project json shared by every request of this process
+project_cache = PlanCache(fetch_project, CACHE_SIZE, CACHE_TTL, CACHE_DIR)
+
+
+@instrument.timed('get_floor_plan')
+def get_floor_plan(port_id, use_cache=True):
     """
     Extracts floor plan out of json
     :param port_id: A string that represents Archi id of floor plan
+    :param use_cache: A boolean indicating whether a cached project can be used
     :return: [floor_plan] = json of floor plan
     """
-    url = 'https://api.archisketch.com/v1/public/projects/'
-    response = requests.get(url + port_id + '/detail')
-    response = response.json()['project']
+    if use_cache:
+        response = project_cache.get(port_id)
+    else:
+        response = fetch_project(port_id)
     floor_plan = response['floorplans'][0]
     return floor_plan
 
@@ -32,7 +106,15 @@ def get_room_and_items(port_id):
     floor_plan = get_floor_plan(port_id)
     if floor_plan is None:
         return [], [], [], []
+    return parse_floor_plan(floor_plan)
+
 
+def parse_floor_plan(floor_plan):
+    """
+    Extracts room and item information out of the json of a floor plan
+    :param floor_plan: Dictionary of floor plan json
+    :return: [corners], [walls], [rooms], [items], see get_room_and_items
+    """
     corners = [{
         'id': c['archiId'],
         'position': c['position']
@@ -53,7 +135,18 @@ def get_room_and_items(port_id):
         'type': r['type']
     } for r in floor_plan['rooms']]
 
-    items = [{
+    items = [item_record(i) for i in floor_plan['items']]
+
+    return corners, walls, rooms, items
+
+
+def item_record(i):
+    """
+    Extracts item information out of the json of an item
+    :param i: Dictionary of item json
+    :return: [item] = Dictionary containing information on the item, in the form ItemBatch is created from (item.py)
+    """
+    return {
         'archi_id': i['archiId'],
         'category': i['meta'].get('categories'),
         'archiCategory': i['meta'].get('archiCategories'),
@@ -62,9 +155,7 @@ def get_room_and_items(port_id):
         'code': i['meta'].get('editorType').get('code'),
         'rotation': i['rotation'].get('y'),
         'scale': i['scale']
-    } for i in floor_plan['items']]
-
-    return corners, walls, rooms, items
+    }
 
 
 def corner_by_id(corner_id, c_list):
@@ -87,17 +178,120 @@ def create_objects(port_id, interval=None):
     :return: [corners] = List of Corner objects (floor_plan.py)
              [walls] = List of Wall objects (floor_plan.py)
              [rooms] = List of Room objects (floor_plan.py)
-             [items] = List of Item objects (floor_plan.py)
+             [items] = List of Item objects (item.py), views of one ItemBatch
     """
-    corners_json, walls_json, rooms_json, items_json = get_room_and_items(port_id)
+    return json_objects(*get_room_and_items(port_id), interval=interval)
 
+
+def json_objects(corners_json, walls_json, rooms_json, items_json, interval=None):
+    """
+    Returns list of corner, wall, room, and item objects from the information extracted from json
+    :param corners_json: List of dictionaries of corners, see get_room_and_items
+    :param walls_json: List of dictionaries of walls
+    :param rooms_json: List of dictionaries of rooms
+    :param items_json: List of dictionaries of items
+    :param interval: Interval between mesh points to be created in floor plan
+    :return: [corners], [walls], [rooms], [items], see create_objects
+    """
     corners = [Corner(c['id'], c['position']) for c in corners_json]
     walls = [Wall(w['start'], w['end'], w['height'], w['thickness']) for w in walls_json]
     rooms = [Room(r['corners'], r['inner_points'], r['height'], r['label'], r['type'], interval) for r in rooms_json]
-    items = [Item(i['archi_id'], i['category'], i['archiCategory'], i['dimensions'], i['position'], i['code'], i['rotation'], i['scale']) for i in items_json]
+    items = ItemBatch(items_json).items
     return corners, walls, rooms, items
 
 
+def floor_plan_from_json(floor_plan, interval=None):
+    """
+    Creates a FloorPlan object from the json of a floor plan, without the Archisketch API
+    :param floor_plan: Dictionary of floor plan json
+    :param interval: Interval between mesh points to be created in floor plan
+    :return: A FloorPlan object (floor_plan.py)
+    """
+    corner_list, wall_list, room_list, item_list = json_objects(*parse_floor_plan(floor_plan), interval=interval)
+    return FloorPlan(corner_list, wall_list, room_list, interval=interval, item_list=item_list)
+
+
+@instrument.timed('build_floor_plan')
+def build_floor_plan(project, interval=None):
+    """
+    Creates a FloorPlan object with information extracted from project json
+    :param project: Dictionary of project json, see fetch_project
+    :param interval: Interval between mesh points to be created in floor plan
+    :return: A FloorPlan object (floor_plan.py)
+    """
+    return floor_plan_from_json(project['floorplans'][0], interval)
+
+
+# Cache of constructed floor plans shared by every request of this process
+floor_cache = FloorCache(build_floor_plan, FLOOR_CACHE_SIZE)
+
+
+def pinned_project(port_id):
+    """
+    Returns the current project json together with the revision that floor plans of it are cached under. Both come from
+    one cache entry, so a floor plan built from the project is stored under the revision of that project.
+    :param port_id: A string that represents Archi id of floor plan
+    :return: [project] = json of project
+             [revision] = The revision of the project, or the time it was fetched if the project json has no revision
+             information
+    """
+    entry = project_cache.get_entry(port_id)
+    # Without revision information the floor plan is rebuilt whenever the project is fetched again
+    revision = entry['revision'] if entry['revision'] is not None else ('fetched', entry['fetched_at'])
+    return entry['project'], revision
+
+
+def load_floor_plan(port_id, interval=None, pinned=None):
+    """
+    Returns a FloorPlan object of the current revision of the project. Floor plans are built once per revision and
+    interval and shared by every call, analyses do not change them.
+    :param port_id: A string that represents Archi id of floor plan
+    :param interval: Interval between mesh points to be created in floor plan
+    :param pinned: Tuple of the project json and its revision to use, see pinned_project. The current project if None
+    :return: A FloorPlan object (floor_plan.py)
+    """
+    project, revision = pinned if pinned is not None else pinned_project(port_id)
+    return floor_cache.get(port_id, interval, revision, project)
+
+
+# Analyses of the combined endpoint, cheapest first: name -> (mesh interval, function of the floor plan).
+# Analyses with interval None only use the items of the rooms and give the same result on a floor plan of any interval
+ANALYSES = OrderedDict([
+    ('workstations', (None, lambda floor: analysis.work_station_all(floor.rooms))),
+    ('probability', (None, lambda floor: analysis.probability_all(floor.rooms))),
+    ('covid', (500, lambda floor: corona.score_all(floor.rooms))),
+    ('movement', (450, lambda floor: analysis.human_movement(floor))),
+    ('privacy', (450, lambda floor: analysis.privacy_all(floor))),
+])
+
+
+def analyze(port_id, metrics=None):
+    """
+    Runs several analyses of one revision of a floor plan, cheapest first. Each floor plan is built once and shared
+    by the analyses, so its pruned meshes are too. An analysis that fails does not stop the ones after it.
+    :param port_id: A string that represents Archi id of floor plan
+    :param metrics: List of names of ANALYSES to run. Every analysis if None
+    :return: Generator of (name, result, error) of each analysis, as soon as it is finished. [error] is None, or
+    the error the analysis failed with and [result] is None
+    """
+    names = [m for m in ANALYSES.keys() if metrics is None or m in metrics]
+    # Analyses that only need the items run on a floor plan that is built anyway
+    intervals = [ANALYSES[m][0] for m in names if ANALYSES[m][0] is not None]
+    shared = min(intervals) if len(intervals) else None
+    pinned = None
+    for m in names:
+        interval, function = ANALYSES[m]
+        try:
+            if pinned is None:
+                pinned = pinned_project(port_id)
+            floor = load_floor_plan(port_id, interval if interval is not None else shared, pinned)
+            result = function(floor)
+        except Exception as e:
+            yield m, None, repr(e)
+            continue
+        yield m, result, None
+
+
 if __name__ == '__main__':
     # EXAMPLE: 'XOOErmT8302DC3437D34541': test_room 9, 'XN6RiYo132FC530F34C4A01': test_room 1
     corner_list, wall_list, room_list, item_list = create_objects('XN6RiYo132FC530F34C4A01', 500)
@@ -1,11 +1,17 @@
-from flask import Flask, request
+from flask import Flask, Response, request
 import api_manager
 from floor_plan import Room, Corner, Wall, FloorPlan
 import analysis
 import corona
+import session
+import jobs
+import instrument
+import profiling
 import json
 
 application = Flask(__name__)
+instrument.install(application)
+profiling.install(application)
 
 
 @application.route('/')
@@ -13,6 +19,27 @@ def root():
     return "Hello Archisketch"
 
 
+@application.route('/metrics')
+def get_metrics():
+    return Response(instrument.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+
+@application.route('/profiles/<profile_id>')
+def get_profile(profile_id):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return json.dumps({'status': 'FAILED', 'message': 'The profile does not exist'}), 404
+    return {k: v for k, v in profile.items() if k != 'collapsed'}
+
+
+@application.route('/profiles/<profile_id>/collapsed')
+def get_profile_stacks(profile_id):
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return json.dumps({'status': 'FAILED', 'message': 'The profile does not exist'}), 404
+    return Response(profile['collapsed'], mimetype='text/plain')
+
+
 @application.route('/<port_id>')
 def show_floor_plan_id(port_id):
     return api_manager.get_floor_plan(port_id)
@@ -20,36 +47,37 @@ def show_floor_plan_id(port_id):
 
 @application.route('/workstations/<port_id>')
 def get_work_stations(port_id):
-    corner_list, wall_list, room_list, item_list = api_manager.create_objects(port_id)
-    floor_plan = FloorPlan(corner_list, wall_list, room_list, item_list=item_list)
+    floor_plan = api_manager.load_floor_plan(port_id)
     return analysis.work_station_all(floor_plan.rooms)
 
 
 @application.route('/covid/<port_id>')
 def get_covid_score(port_id):
-    corner_list, wall_list, room_list, item_list = api_manager.create_objects(port_id, 500)
-    floor_plan = FloorPlan(corner_list, wall_list, room_list, interval=500, item_list=item_list)
+    floor_plan = api_manager.load_floor_plan(port_id, 500)
     return corona.score_all(floor_plan.rooms)
 
 
+@application.route('/sanitizers/<port_id>')
+def get_sanitizer_placement(port_id):
+    floor_plan = api_manager.load_floor_plan(port_id, 500)
+    return corona.place_sanitizers_all(floor_plan.rooms, request.args.get('count', 1, type=int))
+
+
 @application.route('/probability/<port_id>')
 def get_probability(port_id):
-    corner_list, wall_list, room_list, item_list = api_manager.create_objects(port_id)
-    floor_plan = FloorPlan(corner_list, wall_list, room_list, item_list=item_list)
+    floor_plan = api_manager.load_floor_plan(port_id)
     return analysis.probability_all(floor_plan.rooms)
 
 
 @application.route('/movement/<port_id>')
 def get_human_movement(port_id):
-    corner_list, wall_list, room_list, item_list = api_manager.create_objects(port_id, 450)
-    floor_plan = FloorPlan(corner_list, wall_list, room_list, interval=450, item_list=item_list)
+    floor_plan = api_manager.load_floor_plan(port_id, 450)
     return analysis.human_movement(floor_plan)
 
 
 @application.route('/viewpoint/<port_id>')
 def get_field_of_view(port_id):
-    corner_list, wall_list, room_list, item_list = api_manager.create_objects(port_id)
-    floor_plan = FloorPlan(corner_list, wall_list, room_list, item_list=item_list)
+    floor_plan = api_manager.load_floor_plan(port_id)
     data = request.data.decode('utf-8')
     try:
         data = json.loads(data)
@@ -62,10 +90,80 @@ def get_field_of_view(port_id):
 
 @application.route('/privacy/<port_id>')
 def get_privacy(port_id):
-    corner_list, wall_list, room_list, item_list = api_manager.create_objects(port_id, 450)
-    floor_plan = FloorPlan(corner_list, wall_list, room_list, interval=450, item_list=item_list)
+    floor_plan = api_manager.load_floor_plan(port_id, 450)
     return analysis.privacy_all(floor_plan)
 
+
+@application.route('/analyze/<port_id>')
+def get_analyses(port_id):
+    metrics = request.args.get('metrics')
+    metrics = metrics.split(',') if metrics else None
+    unknown = [m for m in metrics if m not in api_manager.ANALYSES] if metrics is not None else []
+    if len(unknown):
+        message = 'Unknown analyses: ' + ', '.join(unknown)
+        return json.dumps({'status': 'FAILED', 'message': message}), 400
+
+    # One JSON line per analysis, sent as soon as the analysis is finished. A failed analysis gets a FAILED line
+    def sections():
+        for name, result, error in api_manager.analyze(port_id, metrics):
+            if error is not None:
+                yield json.dumps({'analysis': name, 'status': 'FAILED', 'message': error}) + '\n'
+            else:
+                yield json.dumps({'analysis': name, 'result': result}) + '\n'
+    return Response(sections(), mimetype='application/x-ndjson')
+
+
+@application.route('/jobs/<analysis_name>/<port_id>', methods=['POST'])
+def submit_job(analysis_name, port_id):
+    if analysis_name not in jobs.JOB_ANALYSES:
+        message = 'Unknown analysis: ' + analysis_name
+        return json.dumps({'status': 'FAILED', 'message': message}), 404
+    job = jobs.job_queue.submit(analysis_name, port_id)
+    return job.to_dict(), 202
+
+
+@application.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = jobs.job_queue.get(job_id)
+    if job is None:
+        return json.dumps({'status': 'FAILED', 'message': 'The job does not exist'}), 404
+    return job.to_dict()
+
+
+@application.route('/sessions/<port_id>', methods=['POST'])
+def open_session(port_id):
+    floor_plan = api_manager.load_floor_plan(port_id, 500)
+    session_id = session.open_session(floor_plan)
+    scores = session.get_session(session_id).score()
+    scores['session'] = session_id
+    return scores
+
+
+@application.route('/sessions/<session_id>/edits', methods=['POST'])
+def edit_session(session_id):
+    s = session.get_session(session_id)
+    if s is None:
+        return json.dumps({'status': 'FAILED', 'message': 'The session does not exist'}), 404
+    try:
+        edits = json.loads(request.data.decode('utf-8'))['edits']
+    except (ValueError, KeyError, TypeError):
+        edits = None
+    if not isinstance(edits, list) or not all(isinstance(e, dict) for e in edits):
+        message = 'The input is not a JSON list of edits'
+        return json.dumps({'status': 'FAILED', 'message': message}), 400
+    try:
+        edits = [dict(e, item=api_manager.item_record(e['item'])) if e.get('op') == 'add' else e for e in edits]
+    except (KeyError, TypeError, AttributeError):
+        message = 'The item to add is not in the form of the Archisketch API'
+        return json.dumps({'status': 'FAILED', 'message': message}), 400
+    try:
+        s.apply(edits)
+    except ValueError as e:
+        return json.dumps({'status': 'FAILED', 'message': str(e)}), 400
+    scores = s.score()
+    scores['session'] = session_id
+    return scores
+
 if __name__ == '__main__':
     application.debug = True
     application.run(host='0.0.0.0')
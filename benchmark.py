@@ -0,0 +1,305 @@
+from collections import OrderedDict
+from floor_plan import Room
+import matplotlib.path as mpltPath
+import numpy as np
+import create_graph
+import api_manager
+import synthetic
+import analysis
+import corona
+import a_star
+import subprocess
+import platform
+import argparse
+import json
+import math
+import time
+import tracemalloc
+
+
+def rectangle_room(width, depth, interval):
+    """
+    Creates an empty rectangular Room to benchmark the algorithms without the Archisketch API.
+    :param width: Width of the room
+    :param depth: Depth of the room
+    :param interval: Interval between mesh points of the room
+    :return: A Room object (floor_plan.py)
+    """
+    inner_points = [{'x': 0, 'y': 0, 'z': 0}, {'x': width, 'y': 0, 'z': 0},
+                    {'x': width, 'y': 0, 'z': depth}, {'x': 0, 'y': 0, 'z': depth}]
+    return Room([], inner_points, 1000, 'benchmark', 1, interval)
+
+
+def time_call(func, *args, repeat=3):
+    """
+    Times a function call
+    :param func: Function to be timed
+    :param args: Arguments passed to the function
+    :param repeat: Number of times the function is called
+    :return: [best] = Fastest run time in seconds
+             [result] = Return value of the last call
+    """
+    best = math.inf
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_astar(sizes=(5000, 10000, 20000), interval=450):
+    """
+    Compares astar_search with heap_astar_search between opposite corners of rectangular rooms.
+    :param sizes: Widths (and depths) of the rooms to benchmark
+    :param interval: Interval between mesh points
+    :return: [results] = List of dictionaries with the timings of each room size
+    """
+    results = []
+    for size in sizes:
+        room = rectangle_room(size, size, interval)
+        graph, connected = create_graph.create_corona(room)
+        id_list = room.get_id_list()
+        start, goal = id_list[0], id_list[-1]
+        heuristics = {}
+        (goal_x, goal_y) = room.get_mesh_dict()[goal]
+        for i in id_list:
+            (x, y) = room.get_mesh_dict()[i]
+            heuristics[i] = math.sqrt((goal_x - x) ** 2 + (goal_y - y) ** 2)
+        list_time, list_path = time_call(a_star.astar_search, graph, heuristics, start, goal)
+        heap_time, heap_path = time_call(a_star.heap_astar_search, graph, heuristics, start, goal)
+        results.append({'nodes': len(id_list),
+                        'astar_search': list_time,
+                        'heap_astar_search': heap_time,
+                        'same_length': abs(list_path[-1][1] - heap_path[-1][1]) < 1e-6})
+    return results
+
+
+def bench_graph_memory(sizes=(10000, 20000), interval=450):
+    """
+    Compares the memory used by a Graph with the memory used by the equivalent CompactGraph.
+    :param sizes: Widths (and depths) of the rooms to benchmark
+    :param interval: Interval between mesh points
+    :return: [results] = List of dictionaries with the bytes per edge of each room size
+    """
+    results = []
+    for size in sizes:
+        room = rectangle_room(size, size, interval)
+        tracemalloc.start()
+        graph, connected = create_graph.create_corona(room)
+        graph_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        compact = a_star.CompactGraph.from_graph(graph)
+        compact_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        edges = compact.number_of_edges()
+        results.append({'edges': edges,
+                        'graph_bytes_per_edge': graph_bytes / edges,
+                        'compact_bytes_per_edge': compact_bytes / edges,
+                        'compact_array_bytes_per_edge': compact.nbytes() / edges})
+    return results
+
+
+def bench_graph_build(sizes=(20000, 45000), interval=450):
+    """
+    Times building the mesh graph of rectangular rooms into a Graph and into a CompactGraph.
+    :param sizes: Widths (and depths) of the rooms to benchmark
+    :param interval: Interval between mesh points
+    :return: [results] = List of dictionaries with the timings of each room size
+    """
+    results = []
+    for size in sizes:
+        room = rectangle_room(size, size, interval)
+        graph_time, _ = time_call(create_graph.make_nodes_room, a_star.Graph(), room)
+        compact_time, _ = time_call(lambda: create_graph.make_nodes_room(a_star.GraphBuilder(), room))
+        build_time, _ = time_call(lambda: create_graph.create_corona(room, compact=True))
+        results.append({'nodes': len(room.get_id_list()),
+                        'make_nodes_room_graph': graph_time,
+                        'make_nodes_room_builder': compact_time,
+                        'create_corona_compact': build_time})
+    return results
+
+
+def bench_mesh_memory(sizes=(20000, 90000), interval=450):
+    """
+    Compares the memory used by the array backed mesh of a room with the memory used by the equivalent dictionary.
+    :param sizes: Widths (and depths) of the rooms to benchmark
+    :param interval: Interval between mesh points
+    :return: [results] = List of dictionaries with the bytes per mesh point of each room size
+    """
+    results = []
+    for size in sizes:
+        tracemalloc.start()
+        room = rectangle_room(size, size, interval)
+        mesh_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        mesh_dict = dict(room.base_mesh.items())
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        points = len(mesh_dict)
+        results.append({'points': points,
+                        'mesh_bytes_per_point': mesh_bytes / points,
+                        'dict_bytes_per_point': dict_bytes / points})
+    return results
+
+
+def privacy_by_polygons(room, obstacles):
+    """
+    Reference privacy computation: one view polygon per mesh point, tested against every other mesh point.
+    :param room: Room object
+    :param obstacles: Dictionary of obstacles inside the room
+    :return: [occurrence] - Dictionary showing how often a mesh point can be viewed from other mesh points
+    """
+    mesh = room.get_mesh_dict()
+    occurrence = {i: 0 for i in mesh.keys()}
+    for (x, y) in mesh.values():
+        view_poly = mpltPath.Path(analysis.point_view(room, x, y, obstacles, False))
+        for j in mesh.keys():
+            if view_poly.contains_point(mesh[j]):
+                occurrence[j] += 1
+    return occurrence
+
+
+def bench_privacy(sizes=(14500, 22000, 32000), interval=450, reference_points=1500):
+    """
+    Times analysis.privacy on rectangular rooms with columns, against the per point view polygon reference on the
+    rooms small enough for it.
+    :param sizes: Widths (and depths) of the rooms to benchmark
+    :param interval: Interval between mesh points
+    :param reference_points: Largest number of mesh points the reference is timed on
+    :return: [results] = List of dictionaries with the timings of each room size
+    """
+    results = []
+    for size in sizes:
+        room = rectangle_room(size, size, interval)
+        obstacles = {}
+        for k in range(1, 4):
+            (x, y) = (size * k / 4 + 7, size / 2 + 13)
+            obstacles[(x, y)] = [(x - 400, y - 400), (x + 400, y - 400), (x + 400, y + 400), (x - 400, y + 400)]
+        engine_time, occurrence = time_call(analysis.privacy, room, obstacles, repeat=1)
+        result = {'points': len(room.get_id_list()), 'privacy': engine_time}
+        if len(room.get_id_list()) <= reference_points:
+            reference_time, reference = time_call(privacy_by_polygons, room, obstacles, repeat=1)
+            result['view_polygons'] = reference_time
+            result['same_counts'] = reference == occurrence
+        results.append(result)
+    return results
+
+
+def time_scenario(func, repeat=3):
+    """
+    Times a function called without arguments
+    :param func: Function to be timed
+    :param repeat: Number of times the function is called
+    :return: [timing] = Dictionary with the fastest and mean run time in seconds and the number of runs
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'mean': sum(times) / len(times), 'repeat': repeat}
+
+
+def git_commit():
+    """
+    Returns the commit the benchmarked code is at, or None outside of a git checkout
+    :return: A string of the commit hash, or None
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(columns=2, rows=2, desks=4, chairs_per_desk=2, seed=0, repeat=3):
+    """
+    Times the core kernels and the analysis behind every endpoint on a synthetic floor plan (synthetic.py). The floor
+    plan is parsed from json like the projects of the Archisketch API, with the mesh interval of each endpoint.
+    :param columns: Number of rooms along x
+    :param rows: Number of rooms along z
+    :param desks: Number of desks in each room
+    :param chairs_per_desk: Number of chairs at each desk
+    :param seed: Seed of the synthetic floor plan
+    :param repeat: Number of runs of each scenario
+    :return: [results] = Dictionary of the parameters, floor plan size, environment and timing of every scenario
+    """
+    project = synthetic.synthetic_project(seed, columns, rows, desks=desks, chairs_per_desk=chairs_per_desk)
+    plan = project['floorplans'][0]
+    floor = api_manager.floor_plan_from_json(plan)
+    floor_450 = api_manager.floor_plan_from_json(plan, 450)
+    floor_500 = api_manager.floor_plan_from_json(plan, 500)
+
+    # Kernels run on the first room
+    room = floor_450.rooms[0]
+    obstacles = analysis.room_obstacles(floor_450, room)
+    xs, ys = zip(*room.room_polygon())
+    (x, y) = ((min(xs) + max(xs)) / 2 + 7, (min(ys) + max(ys)) / 2 + 13)
+    graph, connected = create_graph.create_corona(room)
+    mesh = room.get_mesh_dict()
+    id_list = room.get_id_list()
+    (start, goal) = (id_list[0], id_list[-1])
+    points = dict(mesh.items())
+    points.update({c: coord for c, (coord, _, _) in room.chair_node_items().items()})
+    heuristics = {i: math.sqrt((mesh[goal][0] - p[0]) ** 2 + (mesh[goal][1] - p[1]) ** 2) for i, p in points.items()}
+
+    scenarios = OrderedDict([
+        ('build_floor_plan', lambda: api_manager.floor_plan_from_json(plan, 450)),
+        ('merge_mesh', room.merge_mesh),
+        ('update_mesh', room.mesh_mask),
+        ('create_analysis', lambda: create_graph.create_analysis(floor_450, compact=True)),
+        ('create_corona', lambda: create_graph.create_corona(room, compact=True)),
+        ('astar_search', lambda: a_star.astar_search(graph, heuristics, start, goal)),
+        ('heap_astar_search', lambda: a_star.heap_astar_search(graph, heuristics, start, goal)),
+        ('point_view', lambda: analysis.point_view(room, x, y, obstacles, True)),
+        ('privacy', lambda: analysis.privacy(room, obstacles)),
+        ('endpoint.workstations', lambda: analysis.work_station_all(floor.rooms)),
+        ('endpoint.covid', lambda: corona.score_all(floor_500.rooms)),
+        ('endpoint.sanitizers', lambda: corona.place_sanitizers_all(floor_500.rooms)),
+        ('endpoint.probability', lambda: analysis.probability_all(floor.rooms)),
+        ('endpoint.movement', lambda: analysis.human_movement(floor_450)),
+        ('endpoint.viewpoint', lambda: analysis.point_view_all(floor, x, y)),
+        ('endpoint.privacy', lambda: analysis.privacy_all(floor_450)),
+    ])
+    timings = OrderedDict()
+    for name, func in scenarios.items():
+        timings[name] = time_scenario(func, repeat)
+
+    return {'commit': git_commit(),
+            'parameters': {'columns': columns, 'rows': rows, 'desks': desks, 'chairs_per_desk': chairs_per_desk,
+                           'seed': seed, 'repeat': repeat},
+            'floor_plan': {'rooms': len(floor.rooms), 'items': len(floor.items),
+                           'chairs': sum([len(r.chair_items()) for r in floor.rooms]),
+                           'mesh_points_450': len(floor_450.get_id_list()),
+                           'kernel_room_mesh_points': len(id_list)},
+            'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'platform': platform.platform()},
+            'scenarios': timings}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the analyses on a synthetic floor plan, as json')
+    parser.add_argument('--columns', type=int, default=2, help='Number of rooms along x')
+    parser.add_argument('--rows', type=int, default=2, help='Number of rooms along z')
+    parser.add_argument('--desks', type=int, default=4, help='Number of desks in each room')
+    parser.add_argument('--chairs', type=int, default=2, help='Number of chairs at each desk')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each scenario')
+    parser.add_argument('--output', help='File the results are written to, standard output if not given')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also compare the current implementations with the earlier ones on empty rooms')
+    args = parser.parse_args()
+    results = bench_suite(args.columns, args.rows, args.desks, args.chairs, args.seed, args.repeat)
+    if args.compare:
+        results['comparisons'] = {'astar': bench_astar(), 'graph_memory': bench_graph_memory(),
+                                  'graph_build': bench_graph_build(), 'mesh_memory': bench_mesh_memory(),
+                                  'privacy': bench_privacy()}
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
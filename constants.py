@@ -1,3 +1,5 @@
+import os
+
 RAD_LEN = 977
 DIST_LEN = 900
 SANITIZE_FIRST = 5000
@@ -10,4 +12,41 @@ CHAIR_PROB = {"3BDCB55FABF94B0D": 0.6,
               "81326D90BC5E4C1D": 0.1,
               "3F877C0C80134DFC": 0.4,
               "23833539033C4061": 0.3}
-REC_COUNT = 20
+# Weights of the chair metrics in the COVID-19 score (corona.score)
+SCORE_WEIGHTS = {'santizer': 0.1,
+                 'chair_distance': 0.2,
+                 'chairs_in_radius': 0.4,
+                 'square_footage': 0.2,
+                 'number_of_chairs': 0.1}
+# Number of worker processes the per-room analyses fan out to. 1 runs every room in the calling process
+WORKERS = 1
+# Fetched floor plans: number of projects kept in memory, seconds before a project is fetched again, and directory
+# of the on-disk store (None keeps projects in memory only)
+CACHE_SIZE = 32
+CACHE_TTL = 300
+CACHE_DIR = None
+# Base url of the Archisketch project API. Projects are fetched from <API_URL><port_id>/detail
+API_URL = os.environ.get('ARCHISKETCH_API_URL', 'https://api.archisketch.com/v1/public/projects/')
+# Directory of recorded projects (<port_id>.json) used instead of the Archisketch API, and seconds each project takes
+# to load from it. Synthetic projects (synthetic.py) can be written to it as synthetic-<seed>.json
+PROJECT_DIR = os.environ.get('ARCHISKETCH_PROJECT_DIR')
+PROJECT_LATENCY = float(os.environ.get('ARCHISKETCH_PROJECT_LATENCY', 0))
+# Largest total number of mesh points and items of the constructed floor plans kept in memory
+FLOOR_CACHE_SIZE = 500000
+# Number of open editing sessions (session.py) kept in memory
+SESSION_COUNT = 64
+# Analysis jobs (jobs.py): number of jobs run at the same time, and number of jobs and results kept in memory
+JOB_WORKERS = 2
+JOB_COUNT = 100
+# Stage timers and counters (instrument.py) and the X-Timing response header on every response. Without
+# TIMING_HEADER the header is only added to requests that send an X-Timing header
+INSTRUMENT = False
+TIMING_HEADER = False
+# Request profiling (profiling.py): whether requests can ask to be profiled, number of functions listed, seconds
+# between stack samples, number of profiles kept in memory, and directory the profiles are written to (None keeps
+# them in memory only)
+PROFILING = False
+PROFILE_TOP = 30
+PROFILE_INTERVAL = 0.005
+PROFILE_COUNT = 20
+PROFILE_DIR = None
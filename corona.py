@@ -1,6 +1,10 @@
 import matplotlib.colors as clr
+from spatial_index import GridIndex
 import create_graph
-import math
+import parallel
+import a_star
+import numpy as np
+import heapq
 from constants import *
 
 bad = (1, 0, 0)
@@ -9,32 +13,39 @@ decent = (1, 0.917647058, 0)
 good = (0, 1, 0.16470588)
 cmap = clr.LinearSegmentedColormap.from_list('custom', ['green', 'yellow', 'red'], N=256)
 
+# Chair metrics of the COVID-19 score, in the column order of the metric matrix. Weights are in SCORE_WEIGHTS
+METRICS = ('santizer', 'chair_distance', 'chairs_in_radius', 'square_footage', 'number_of_chairs')
 
-def sanitize(room, updated=False):
+
+def sanitize(room):
     """
     For now, assumes that sanitizer is deployed at first point in the room.
     Finds shortest path of all chairs from the sanitizer and labels chairs different colors depending on the distance.
+    Chairs the sanitizer cannot reach get the score of chairs beyond SANITIZE_SECOND.
     :param room: A Room object (floor_plan.py)
-    :param updated: A boolean indicating whether mesh has been updated or not
     :return: [score_dict] = Dictionary that has a score assigned to every chair
     """
-    # Checks if mesh has been updated or not
-    if updated:
-        grid_points = room.get_merged_coordinates()
-    else:
-        grid_points = room.update_mesh()
+    return sanitize_chairs(room.get_mesh_dict(), room.get_interval(), room.chair_node_items())
+
 
-    id_points = room.get_id_list()
-    first_id = id_points[0]
-    chair_dict = room.chair_node_items()
+def sanitize_chairs(mesh, interval, chair_dict):
+    """
+    Scores chairs by their path distance from the sanitizer at the first mesh point, see sanitize. Uses the mesh and
+    chair nodes of a room instead of the Room object, so it can run in a worker process.
+    :param mesh: Mesh object (mesh.py) of the room
+    :param interval: Interval between mesh points
+    :param chair_dict: Dictionary of chair nodes of the room (see Room.chair_node_items)
+    :return: [score_dict] = Dictionary that has a score assigned to every chair
+    """
+    first_id = mesh.get_id_list()[0]
     score_dict = {}
 
-    # Creates graph with connections
-    graph, connected = create_graph.create_corona(room)
+    # Creates graph with connections. One shortest path tree from the sanitizer reaches every chair
+    graph, connected = create_graph.create_mesh_corona(mesh, interval, chair_dict, compact=True)
+    distances, predecessors = a_star.shortest_path_tree(graph, first_id)
     for c in chair_dict.keys():
-        shortest, heuristics = create_graph.shortest_path(graph, room, c, first_id)
-        if shortest is not None:
-            path_length = shortest[len(shortest) - 1][1]
+        if c in distances:
+            path_length = distances[c]
             if path_length < SANITIZE_FIRST:
                 score_dict[c] = 0
             elif path_length < SANITIZE_SECOND:
@@ -42,17 +53,202 @@ def sanitize(room, updated=False):
             else:
                 score_dict[c] = 1
         else:
-            score_dict[c] = 0
+            # Unreachable, as far from the sanitizer as a chair can be (coverage 0, see sanitizer_coverage)
+            score_dict[c] = 1
 
     return score_dict
 
 
+def sanitizer_coverage(mesh, interval, chair_dict):
+    """
+    Finds how well a sanitizer placed on each mesh point of the room serves each chair. Path distances come from one
+    Dijkstra search per chair, stopped at SANITIZE_SECOND. The graph is undirected, so the distance from a chair to a
+    mesh point is the distance from the mesh point to the chair.
+    :param mesh: Mesh object (mesh.py) of the room
+    :param interval: Interval between mesh points
+    :param chair_dict: Dictionary of chair nodes of the room (see Room.chair_node_items)
+    :return: [candidates] = List of mesh ids where a sanitizer can be placed
+             [chair_keys] = List of chair ids in form "chair #"
+             [coverage] = Array of shape (chairs, candidates). 1 within SANITIZE_FIRST, 0.5 within SANITIZE_SECOND,
+             0 further or unreachable. One minus coverage is the sanitize score of the chair
+    """
+    graph, connected = create_graph.create_mesh_corona(mesh, interval, chair_dict, compact=True)
+    candidates = mesh.get_id_list()
+    candidate_ids = np.array([graph.node_id(c) for c in candidates], dtype=np.int64)
+    chair_keys = list(chair_dict.keys())
+    coverage = np.zeros((len(chair_keys), len(candidates)))
+    for k, c in enumerate(chair_keys):
+        dist, pred = graph.shortest_path_tree(graph.node_id(c), SANITIZE_SECOND)
+        dist = dist[candidate_ids]
+        coverage[k] = np.where(dist < SANITIZE_FIRST, 1, np.where(dist < SANITIZE_SECOND, 0.5, 0))
+    return candidates, chair_keys, coverage
+
+
+def greedy_placement(coverage, count):
+    """
+    Chooses up to [count] candidates that maximize the total coverage of the chairs, where each chair is covered by its
+    best chosen candidate. Adding a candidate never increases the gain of the others, so the lazy greedy search only
+    recomputes the gain of the candidate with the largest stale gain, and takes it if it is still the largest.
+    :param coverage: Array of shape (chairs, candidates), see sanitizer_coverage
+    :param count: Largest number of candidates to choose
+    :return: [chosen] = List of column indices of the chosen candidates, in the order they were chosen. Stops early
+             once no candidate improves the coverage
+    """
+    best = np.zeros(len(coverage))
+    open_heap = [(-g, j) for j, g in enumerate(coverage.sum(axis=0).tolist()) if g > 0]
+    heapq.heapify(open_heap)
+    chosen = []
+    while open_heap and len(chosen) < count:
+        _, j = heapq.heappop(open_heap)
+        gain = float(np.maximum(coverage[:, j] - best, 0).sum())
+        if gain <= 0:
+            continue
+        if open_heap and gain < -open_heap[0][0]:
+            heapq.heappush(open_heap, (-gain, j))
+            continue
+        chosen.append(j)
+        best = np.maximum(best, coverage[:, j])
+    return chosen
+
+
+def place_sanitizers(room, count=1):
+    """
+    Recommends where to place [count] sanitizers in a room so that as few chairs as possible are further than
+    SANITIZE_FIRST and SANITIZE_SECOND path distance from their closest sanitizer.
+    :param room: A Room object (floor_plan.py)
+    :param count: Number of sanitizers to place
+    :return: [placement] = Dictionary with the positions of the sanitizers and the number of chairs within
+             SANITIZE_FIRST, within SANITIZE_SECOND and beyond
+    """
+    return placement((room_payload(room), count))
+
+
+def placement(payload):
+    """
+    Recommends sanitizer positions from the payload of a room, see place_sanitizers. Serves as a helper function for
+    place_sanitizers_all and can run in a worker process.
+    :param payload: Tuple of the payload of the room (see room_payload) and the number of sanitizers to place
+    :return: [placement] = see place_sanitizers
+    """
+    (mesh, interval, chair_dict, positions, _), count = payload
+    if len(mesh) == 0 or len(positions) == 0:
+        return {'sanitizers': [], 'chairs': {'first': 0, 'second': 0, 'beyond': len(positions)}}
+    candidates, chair_keys, coverage = sanitizer_coverage(mesh, interval, chair_dict)
+    chosen = greedy_placement(coverage, count)
+    best = coverage[:, chosen].max(axis=1) if chosen else np.zeros(len(chair_keys))
+    return {'sanitizers': [{'position': {'x': mesh[candidates[j]][0], 'z': mesh[candidates[j]][1]}} for j in chosen],
+            'chairs': {'first': int((best == 1).sum()),
+                       'second': int((best == 0.5).sum()),
+                       'beyond': int((best == 0).sum())}}
+
+
+# Recommends [count] sanitizer positions for every room of the floor plan. Rooms are searched in [workers] processes,
+# which get the payloads of the rooms (see room_payload)
+def place_sanitizers_all(room_list, count=1, workers=WORKERS):
+    payloads = [(room_payload(r), count) for r in room_list]
+    return {'rooms': parallel.map_rooms(placement, payloads, workers)}
+
+
+def room_payload(room, c_dict=None, chair_nodes=True):
+    """
+    Collects what the COVID-19 algorithms use of a room, to be sent to worker processes instead of the Room object
+    :param room: A Room object (floor_plan.py)
+    :param c_dict: Dictionary of chair items of the room (see Room.chair_items). Collected if None
+    :param chair_nodes: A boolean indicating whether to find the closest mesh points of the chairs, which the
+            sanitizer algorithms need
+    :return: [payload] = Tuple of the mesh (mesh.py) and mesh interval of the room, dictionary of chair nodes (see
+             Room.chair_node_items), array of shape (chairs, 2) of the chair positions and area of the room
+    """
+    mesh = room.get_mesh_dict()
+    c_dict = room.chair_items() if c_dict is None else c_dict
+    chair_dict = room.chair_node_items() if chair_nodes and len(mesh) and len(c_dict) else {}
+    return mesh, room.get_interval(), chair_dict, chair_positions(c_dict), room.area()
+
+
 # Entire floor plan with the sanitize algorithm
 def sanitize_all(room_list):
     for r in room_list:
         r.update_mesh()
 
 
+def chair_index(positions):
+    """
+    Creates a spatial index over the positions of the chairs, shared by the proximity metrics.
+    :param positions: Array of shape (chairs, 2) of the (x, z) positions of the chairs
+    :return: A GridIndex object (spatial_index.py) whose rows are the chairs in the order of positions
+    """
+    return GridIndex(range(len(positions)), positions, RAD_LEN)
+
+
+def chair_positions(c_dict):
+    """
+    Returns array of shape (chairs, 2) of the (x, z) positions of chair items
+    :param c_dict: Dictionary of chair items (see Room.chair_items)
+    :return: An array
+    """
+    return np.array([(c.x_pos(), c.z_pos()) for c in c_dict.values()], dtype=np.float64).reshape(-1, 2)
+
+
+def dist_column(index):
+    """
+    Scores chairs with another chair within DIST_LEN. Each chair is paired with the first later chair that is too close.
+    :param index: Spatial index of the chairs (see chair_index)
+    :return: Array of the score of every chair
+    """
+    first, second = index.pairs_within(DIST_LEN)
+    too_close = np.zeros(len(index))
+    chairs, closest = np.unique(first, return_index=True)
+    too_close[chairs] = 1
+    too_close[second[closest]] = 1
+    return too_close
+
+
+def radius_column(index, radius=RAD_LEN):
+    """
+    Scores chairs by the number of other chairs within [radius].
+    :param index: Spatial index of the chairs (see chair_index)
+    :param radius: Radius the other chairs are counted in
+    :return: Array of the score of every chair
+    """
+    first, second = index.pairs_within(radius)
+    counts = np.bincount(first, minlength=len(index)) + np.bincount(second, minlength=len(index))
+    return np.where(counts <= 1, 0, np.where(counts <= 3, 0.5, 1.0))
+
+
+def per_sq_column(area, n):
+    """
+    Scores the [n] chairs of a room by the number of chairs per square meter of the room.
+    :param area: Area of the room (see Room.area)
+    :param n: Number of chairs in the room
+    :return: Array of the score of every chair
+    """
+    per_sq = n / (area * 0.000004)
+    return np.full(n, 0 if per_sq <= 0.5 else 0.5 if per_sq <= 1 else 1, dtype=np.float64)
+
+
+def num_column(n):
+    """
+    Scores the [n] chairs of a room by the number of chairs in the room.
+    :param n: Number of chairs in the room
+    :return: Array of the score of every chair
+    """
+    return np.full(n, 0 if n <= 10 else 0.5 if n <= 15 else 1, dtype=np.float64)
+
+
+def sanitize_column(mesh, interval, chair_dict, n):
+    """
+    Scores the [n] chairs of a room by their path distance from the sanitizer.
+    :param mesh: Mesh object (mesh.py) of the room
+    :param interval: Interval between mesh points
+    :param chair_dict: Dictionary of chair nodes of the room (see Room.chair_node_items)
+    :param n: Number of chairs in the room
+    :return: Array of the score of every chair. NaN if the room has no mesh to place the sanitizer on
+    """
+    if n == 0 or len(mesh) == 0:
+        return np.full(n, np.nan)
+    return np.array(list(sanitize_chairs(mesh, interval, chair_dict).values()), dtype=np.float64)
+
+
 def chair_dist(room):
     """
     If a chair item is within 1.8m of another chair, the chair is labeled red and if there are no other chairs within
@@ -61,22 +257,7 @@ def chair_dist(room):
     :return: [score_dict] = A dictionary assigning scores to each chair in the room
     """
     c_dict = room.chair_items()
-    chair_key = list(c_dict.keys())
-    too_close = []
-    for i in range(len(chair_key)):
-        for j in range(i + 1, len(chair_key)):
-            c = chair_key[i]
-            current = chair_key[j]
-            c_x, c_y = c_dict[c].x_pos(), c_dict[c].z_pos()
-            current_x, current_y = c_dict[current].x_pos(), c_dict[current].z_pos()
-            dist = math.sqrt((c_x - current_x) ** 2 + (c_y - current_y) ** 2)
-            if dist <= DIST_LEN:
-                if current not in too_close:
-                    too_close.append(current)
-                if c not in too_close:
-                    too_close.append(c)
-                break
-    score_dict = {c: 1 if c in too_close else 0 for c in chair_key}
+    score_dict = dict(zip(c_dict.keys(), dist_column(chair_index(chair_positions(c_dict))).tolist()))
     return score_dict
 
 
@@ -91,22 +272,11 @@ def chair_radius(room, radius = RAD_LEN):
     If a chair item has 0-1 other chairs within a 1.9m radius then it is labeled green. If it has 2-3 other chairs
     within then its is labeled yellow. 4+, it is labeled red.
     :param room: A Room object
+    :param radius: Radius the other chairs are counted in
     :return: [score_dict] = A dictionary assigning scores to each chair in the room
     """
     c_dict = room.chair_items()
-    chair_key = list(c_dict.keys())
-    score_dict = {}
-    for c in chair_key:
-        count = 0
-        for current in chair_key:
-            if c == current:
-                continue
-            else:
-                x1, y1, x2, y2 = c_dict[c].x_pos(), c_dict[c].z_pos(), c_dict[current].x_pos(), c_dict[current].z_pos()
-                dist = math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-                if dist <= RAD_LEN:
-                    count = count + 1
-        score_dict[c] = 0 if count <= 1 else 0.5 if count <= 3 else 1
+    score_dict = dict(zip(c_dict.keys(), radius_column(chair_index(chair_positions(c_dict)), radius).tolist()))
 
     return score_dict
 
@@ -124,10 +294,7 @@ def chair_per_sq(room):
     :return: [score_dict] = A dictionary assigning scores to each chair in the room
     """
     c_dict = room.chair_items()
-    chair_key = c_dict.keys()
-    sq_m = room.area() * 0.000004
-    per_sq = len(c_dict) / sq_m
-    score_dict = {c: 0 if per_sq <= 0.5 else 0.5 if per_sq <= 1 else 1 for c in chair_key}
+    score_dict = dict(zip(c_dict.keys(), per_sq_column(room.area(), len(c_dict)).tolist()))
     return score_dict
 
 
@@ -147,9 +314,7 @@ def num_chair(room):
     :return: [score_dict] = A dictionary assigning scores to each chair in the room
     """
     c_dict = room.chair_items()
-    chair_key = c_dict.keys()
-    num = len(c_dict)
-    score_dict = {c: 0 if num <= 10 else 0.5 if num <= 15 else 1 for c in chair_key}
+    score_dict = dict(zip(c_dict.keys(), num_column(len(c_dict)).tolist()))
     return score_dict
 
 
@@ -159,65 +324,117 @@ def num_chair_all(room_list):
         num_chair(r)
 
 
+def metric_matrix(room, sanitizer=None):
+    """
+    Scores every chair of a room on every metric in METRICS, see metric_columns.
+    :param room: A Room object (floor_plan.py)
+    :param sanitizer: Array of the sanitizer scores of the chairs, used instead of searching the room graph
+    :return: [chairs] = List of chair Item objects (item.py), in the order of the rows
+             [matrix] = Array of shape (chairs, metrics). NaN where a metric cannot be computed
+    """
+    c_dict = room.chair_items()
+    return list(c_dict.values()), metric_columns(room_payload(room, c_dict, sanitizer is None), sanitizer)
+
+
+def metric_columns(payload, sanitizer=None):
+    """
+    Scores every chair of a room on every metric in METRICS. Each metric fills one column of the matrix. Uses the
+    payload of the room instead of the Room object, so it can run in a worker process.
+    :param payload: Payload of the room, see room_payload
+    :param sanitizer: Array of the sanitizer scores of the chairs, used instead of searching the room graph
+    :return: [matrix] = Array of shape (chairs, metrics). NaN where a metric cannot be computed
+    """
+    mesh, interval, chair_dict, positions, area = payload
+    n = len(positions)
+    index = chair_index(positions)
+    matrix = np.zeros((n, len(METRICS)))
+    if sanitizer is None:
+        sanitizer = sanitize_column(mesh, interval, chair_dict, n)
+    matrix[:, METRICS.index('santizer')] = sanitizer
+    matrix[:, METRICS.index('chair_distance')] = dist_column(index)
+    matrix[:, METRICS.index('chairs_in_radius')] = radius_column(index)
+    matrix[:, METRICS.index('square_footage')] = per_sq_column(area, n)
+    matrix[:, METRICS.index('number_of_chairs')] = num_column(n)
+    return matrix
+
+
+def weighted_total(matrix):
+    """
+    Applies SCORE_WEIGHTS to a metric matrix. The weighted columns are added in the order of METRICS, which gives the
+    same totals as adding the weighted scores of each chair one by one (a BLAS dot product may add in another order).
+    Metrics that could not be computed add nothing.
+    :param matrix: Array of shape (chairs, metrics), see metric_matrix
+    :return: Array of the total score of every chair
+    """
+    total = np.zeros(len(matrix))
+    for k, m in enumerate(METRICS):
+        total = total + SCORE_WEIGHTS[m] * np.nan_to_num(matrix[:, k])
+    return total
+
+
+def score_records(chairs, matrix, totals):
+    """
+    Serializes the scores of chairs.
+    :param chairs: List of chair Item objects (item.py)
+    :param matrix: Array of shape (chairs, metrics), see metric_matrix
+    :param totals: Array of the total score of every chair
+    :return: [score_list] = List of dictionaries with the position, total score and score of each metric of every chair
+    """
+    score_list = []
+    for c_id, row, total_score in zip(chairs, matrix.tolist(), totals.tolist()):
+        score_list.append({'chair_id': c_id.get_archi_id(),
+                           'position': {'x': c_id.x_pos(),
+                                        'y': c_id.y_pos(),
+                                        'z': c_id.z_pos()},
+                           'total_score': total_score,
+                           'scores': {m: metric_value(v) for m, v in zip(METRICS, row)}})
+    return score_list
+
+
+def metric_value(v):
+    """
+    Serializes the score of one metric the way the metric functions gave it: 0 and 1 as integers, 0.5 as a float
+    :param v: Score from a metric matrix
+    :return: [value] = The score, or None if the metric could not be computed
+    """
+    if v != v:
+        return None
+    return int(v) if v.is_integer() else v
+
+
 def score(room):
     """
     Takes score from all functions above and produces a final score for each chair regarding
     COVID-19 protocols and criterion. This function only maps out one room.
     Color legend: Red to green - Bad to good
     :param room: A Room object (floor_plan.py)
-    :param fig: A Matplotlib figure
-    :param ax: Matplotlib axes
-    :return: None
+    :return: {'chairs': [score_list]} = Dictionary with the scores of every chair (see score_records)
     """
-    c_dict = room.chair_items()
-    score_list = []
-    room.update_mesh()
-    if len(room.get_id_list()) == 0:
-        sanitize_score = None
-    else:
-        sanitize_score = sanitize(room, True)
-    rad_score = chair_radius(room)
-    sq_score = chair_per_sq(room)
-    num_score = num_chair(room)
-    dist_score = chair_dist(room)
-    if sanitize_score is not None:
-        for c in c_dict.keys():
-            c_id = c_dict[c]
-            total_score = 0.1 * sanitize_score[c] + 0.2 * dist_score[c] + 0.4 * rad_score[c] + 0.2 * sq_score[c] + 0.1 * num_score[c]
-            score_list.append({'chair_id': c_id.get_archi_id(),
-                               'position': {'x': c_id.x_pos(),
-                                            'y': c_id.y_pos(),
-                                            'z': c_id.z_pos()},
-                               'total_score': total_score,
-                               'scores': {'santizer': sanitize_score[c],
-                                          'chair_distance': dist_score[c],
-                                          'chairs_in_radius': rad_score[c],
-                                          'square_footage': sq_score[c],
-                                          'number_of_chairs': num_score[c]
-                                          }})
-    else:
-        for c in c_dict.keys():
-            total_score = 0.2 * dist_score[c] + 0.4 * rad_score[c] + 0.2 * sq_score[c] + 0.1 * num_score[c]
-            c_id = c_dict[c]
-            score_list.append({'chair_id': c_id.get_archi_id(),
-                               'position': {'x': c_id.x_pos(),
-                                            'y': c_id.y_pos(),
-                                            'z': c_id.z_pos()},
-                               'total_score': total_score,
-                               'scores': {'santizer': sanitize_score[c],
-                                          'chair_distance': dist_score[c],
-                                          'chairs_in_radius': rad_score[c],
-                                          'square_footage': sq_score[c],
-                                          'number_of_chairs': num_score[c]
-                                          }})
-    return {'chairs': score_list}
-
-
-# Plots the entire floor plan with the score algorithm
-def score_all(room_list):
+    chairs, matrix = metric_matrix(room)
+    return {'chairs': score_records(chairs, matrix, weighted_total(matrix))}
+
+
+# Plots the entire floor plan with the score algorithm. The metric matrices of the rooms are built in [workers]
+# processes from the payloads of the rooms (see room_payload) and weighted together
+def score_all(room_list, workers=WORKERS):
+    chairs = [r.chair_items() for r in room_list]
+    payloads = [room_payload(r, c) for r, c in zip(room_list, chairs)]
+    matrices = parallel.map_rooms(metric_columns, payloads, workers)
+    return score_rooms([(list(c.values()), m) for c, m in zip(chairs, matrices)])
+
+
+def score_rooms(results):
+    """
+    Weights the metric matrices of every room together.
+    :param results: List of (chairs, matrix) of every room, see metric_matrix
+    :return: {'covid_rooms': [room_list]} = Dictionary with the chair scores of every room (see score)
+    """
+    if len(results) == 0:
+        return {'covid_rooms': []}
+    totals = weighted_total(np.concatenate([matrix for (_, matrix) in results]))
     score_list = []
-    for r in room_list:
-        r_score = score(r)
-        if r_score is not None:
-            score_list.append(r_score)
+    start = 0
+    for (chairs, matrix) in results:
+        score_list.append({'chairs': score_records(chairs, matrix, totals[start:start + len(chairs)])})
+        start = start + len(chairs)
     return {'covid_rooms': score_list}
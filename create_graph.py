@@ -1,47 +1,57 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import a_star
+import instrument
 import math
 
 
-def door_nodes(graph, floor):
+def door_nodes(graph, floor, overlay=None):
     """
     Creates nodes in the provided graph between door points
     :param graph: A Graph object (a_star.py)
     :param floor: A FloorPlan object (floor_plan.py)
+    :param overlay: Dictionary that the door ids and coordinates are added to. The floor mesh is not changed
     :return: [door_connections] = List of door connections in form (door_id, id of connected node)
     """
     door_list = floor.door_node_items()
-    id_list = floor.get_id_list()
     door_connections = []
-    grid_points = floor.get_merged_coordinates()
 
     # Connects door id points to mesh id points in 500 units radius
     # Door ids are in form of "Door #"
     for d in door_list.keys():
         current = door_list[d]
         (dx, dy) = current[0]
-        closest_points = current[1]
-        for (x, y) in closest_points:
+        for ((x, y), id_point_closest) in zip(current[1], current[2]):
             dist = math.sqrt((dx - x) ** 2 + (dy - y) ** 2)
-            id_point_closest = id_list[grid_points.index((x, y))]
             door_connections.append((d, id_point_closest))
             graph.connect(d, id_point_closest, dist)
-            floor.add_merged_dict(d, (dx, dy))
+            if overlay is not None:
+                overlay[d] = (dx, dy)
 
     return door_connections
 
 
-def chair_nodes_room(graph, room):
+def chair_nodes_room(graph, room, overlay=None):
     """
     Creates connections in the provided graph between chair points of a single room.
     :param graph: A Graph object (a_star.py)
     :param room: A Room object (floor_plan.py)
+    :param overlay: Dictionary that the chair ids and coordinates are added to. The room mesh is not changed
     :return: None
     """
-    grid_points = room.get_merged_coordinates()
-    chair_list = room.chair_node_items()
-    id_list = room.get_id_list()
+    connect_chairs(graph, room.chair_node_items(), overlay)
 
+    return
+
+
+def connect_chairs(graph, chair_list, overlay=None):
+    """
+    Creates connections in the provided graph between chair points and their closest mesh points.
+    :param graph: A Graph object (a_star.py)
+    :param chair_list: Dictionary of chair nodes of a room (see Room.chair_node_items)
+    :param overlay: Dictionary that the chair ids and coordinates are added to
+    :return: None
+    """
     # Connects chair id_points to closest mesh id_points
     # Chair ids are in form of "chair #"
     for c in chair_list.keys():
@@ -49,24 +59,24 @@ def chair_nodes_room(graph, room):
         coord = current[0]
         closest = current[1]
         dist = math.sqrt((coord[0] - closest[0]) ** 2 + (coord[1] - closest[1]) ** 2)
-        id_point_closest = id_list[grid_points.index(closest)]
+        id_point_closest = current[2]
         graph.connect(c, id_point_closest, dist)
-        room.add_merged_dict(c, coord)
+        if overlay is not None:
+            overlay[c] = coord
 
     return
 
 
-def chair_nodes_floor(graph, floor):
+def chair_nodes_floor(graph, floor, overlay=None):
     """
     Creates connections in the provided graph between chair points of the entire floor.
     :param graph: A Graph object (a_star.py)
     :param floor: A FloorPlan object (floor_plan.py)
+    :param overlay: Dictionary that the chair ids and coordinates are added to. The floor mesh is not changed
     :return: [chair_ids] = A list of chair ids in form (room_num, "chair #")
     """
-    id_list = floor.get_id_list()
     room_num = 0
     chair_ids = []
-    grid_points = floor.get_merged_coordinates()
 
     # Connects chair id points to closest mesh id points
     # Chair ids are in form of (room_num, "chair #")
@@ -77,34 +87,101 @@ def chair_nodes_floor(graph, floor):
             coord = current[0]
             closest = current[1]
             dist = math.sqrt((coord[0] - closest[0]) ** 2 + (coord[1] - closest[1]) ** 2)
-            id_point_closest = id_list[grid_points.index(closest)]
+            # Room mesh id (x, y) is floor mesh id (room_num, x, y)
+            id_point_closest = (room_num,) + current[2]
             graph.connect((room_num, c), id_point_closest, dist)
             chair_ids.append((room_num, c))
-            floor.add_merged_dict((room_num, c), coord)
+            if overlay is not None:
+                overlay[(room_num, c)] = coord
         room_num = room_num + 1
 
     return chair_ids
 
 
+# Neighbor directions connected by the mesh graph: (dx, dy, distance in intervals)
+GRID_DIRECTIONS = ((1, 0, 1), (1, 1, math.sqrt(2)), (-1, 1, math.sqrt(2)), (0, 1, 1))
+
+
+def grid_edges(mesh_dict, intervals, fake=True):
+    """
+    Finds the connections between mesh points and their direct neighbors with array operations.
+    The ids of the mesh are scattered into an occupancy array of shape (rooms, y, x) holding row numbers,
+    which is shifted once per neighbor direction.
+    :param mesh_dict: Mesh object (mesh.py) with ids in form (x, y) or (i, x, y). Only its grid points are connected
+    :param intervals: List of mesh intervals of each room i. A single interval if ids are in form (x, y)
+    :param fake: A boolean indicating whether to create the fake mesh points
+    :return: [id_list] = List of mesh point ids
+             [sources] = Array of indices into id_list of the first end of each connection
+             [targets] = Array of indices into id_list of the second end of each connection
+             [distances] = Array of distances of each connection
+             [fake_mesh] = Dictionary of fake mesh point ids at the midpoint of each connection and their coordinates
+    """
+    mesh = mesh_dict.grid()
+    id_list = mesh.get_id_list()
+    if len(id_list) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return id_list, empty, empty, np.zeros(0), {}
+    rows = mesh.rows()
+    x = mesh.ij[rows, 0].astype(np.int64)
+    y = mesh.ij[rows, 1].astype(np.int64)
+    room = mesh.room[rows].astype(np.int64) if mesh.room is not None else np.zeros(len(rows), dtype=np.int64)
+    intervals = np.asarray(intervals, dtype=np.float64).reshape(-1)
+
+    # Occupancy array padded by one cell on every side so that x - 1 and y + 1 stay inside the array
+    occupancy = np.full((room.max() + 1, y.max() + 3, x.max() + 3), -1, dtype=np.int64)
+    occupancy[room, y + 1, x + 1] = np.arange(len(rows))
+
+    # Neighbors of every point in each direction, shape (points, directions). -1 where there is no neighbor
+    neighbors = np.column_stack([occupancy[room, y + 1 + dy, x + 1 + dx] for (dx, dy, _) in GRID_DIRECTIONS])
+    factors = np.array([f for (_, _, f) in GRID_DIRECTIONS])
+    offsets = np.array([(dx, dy) for (dx, dy, _) in GRID_DIRECTIONS]) / 2
+    valid = neighbors >= 0
+
+    # Row-major selection keeps the order the connections were made in point by point
+    sources, direction = np.nonzero(valid)
+    targets = neighbors[valid]
+    distances = intervals[room[sources]] * factors[direction]
+
+    if not fake:
+        return id_list, sources, targets, distances, {}
+
+    # Fake points at the midpoint of every connection
+    coords = mesh.xy[rows]
+    mid_coords = (coords[sources] + coords[targets]) / 2
+    mid_x = x[sources] + offsets[direction, 0]
+    mid_y = y[sources] + offsets[direction, 1]
+    if mesh.room is None:
+        mid_ids = zip(mid_x.tolist(), mid_y.tolist())
+    else:
+        mid_ids = zip(room[sources].tolist(), mid_x.tolist(), mid_y.tolist())
+    fake_mesh = dict(zip(mid_ids, map(tuple, mid_coords.tolist())))
+
+    return id_list, sources, targets, distances, fake_mesh
+
+
 def make_nodes_room(graph, room):
     """
     Creates nodes in the provided graph between mesh points for a single room.
-    :param graph: A Graph object (a_star.py)
+    :param graph: A Graph or GraphBuilder object (a_star.py)
     :param room:  A Room object (floor_plan.py)
     :return: None
     """
-    id_list = room.get_id_list()
+    make_nodes_mesh(graph, room.get_mesh_dict(), room.get_interval())
+
+    return
+
 
+def make_nodes_mesh(graph, mesh, interval):
+    """
+    Creates nodes in the provided graph between the points of the mesh of a single room.
+    :param graph: A Graph or GraphBuilder object (a_star.py)
+    :param mesh: Mesh object (mesh.py) of the room
+    :param interval: Interval between mesh points
+    :return: None
+    """
     # Connects each point to direct neighbors vertically, horizontally, and diagonally, if such points exist.
-    for (x, y) in id_list:
-        if (x + 1, y) in id_list:
-            graph.connect((x, y), (x + 1, y), room.get_interval())
-        if (x + 1, y + 1) in id_list:
-            graph.connect((x, y), (x + 1, y + 1), room.get_interval() * math.sqrt(2))
-        if (x - 1, y + 1) in id_list:
-            graph.connect((x, y), (x - 1, y + 1), room.get_interval() * math.sqrt(2))
-        if (x, y + 1) in id_list:
-            graph.connect((x, y), (x, y + 1), room.get_interval())
+    id_list, sources, targets, distances, fake_mesh = grid_edges(mesh, [interval], False)
+    connect_grid(graph, id_list, sources, targets, distances)
 
     return
 
@@ -112,81 +189,108 @@ def make_nodes_room(graph, room):
 def make_nodes_floor(graph, floor):
     """
     Creates nodes in the provided graph between mesh points for the entire floor plan.
-    :param graph: A Graph object (a_star.py)
+    :param graph: A Graph or GraphBuilder object (a_star.py)
     :param floor: A FloorPlan object (floor_plan.py)
     :return: [fake_mesh] = List of fake mesh point ids
     """
-    mesh_dict = floor.get_mesh_dict()
-    id_list = floor.get_id_list()
-    fake_mesh = {}
-
     # Connects each point to direct neighbors vertically, horizontally, and diagonally, if such points exist.
     # For every connection made, a fake point is created at the midpoint and appended to [fake_mesh]
-    for (i, x, y) in id_list:
-        (mx, my) = mesh_dict[(i, x, y)]
-        interval = floor.rooms[i].get_interval()
-        if (i, x + 1, y) in id_list:
-            (nx, ny) = mesh_dict[(i, x + 1, y)]
-            graph.connect((i, x, y), (i, x + 1, y), interval)
-            fake_mesh[(i, x + 0.5, y)] = ((mx + nx) / 2, ny)
-        if (i, x + 1, y + 1) in id_list:
-            (nx, ny) = mesh_dict[(i, x + 1, y + 1)]
-            graph.connect((i, x, y), (i, x + 1, y + 1), interval * math.sqrt(2))
-            fake_mesh[(i, x + 0.5, y + 0.5)] = ((mx + nx) / 2, (my + ny) / 2)
-        if (i, x - 1, y + 1) in id_list:
-            (nx, ny) = mesh_dict[(i, x - 1, y + 1)]
-            graph.connect((i, x, y), (i, x - 1, y + 1), interval * math.sqrt(2))
-            fake_mesh[(i, x - 0.5, y + 0.5)] = ((mx + nx) / 2, (my + ny) / 2)
-        if (i, x, y + 1) in id_list:
-            (nx, ny) = mesh_dict[(i, x, y + 1)]
-            graph.connect((i, x, y), (i, x, y + 1), interval)
-            fake_mesh[(i, x, y + 0.5)] = (mx, (my + ny) / 2)
+    intervals = [r.get_interval() for r in floor.rooms]
+    id_list, sources, targets, distances, fake_mesh = grid_edges(floor.get_mesh_dict(), intervals)
+    connect_grid(graph, id_list, sources, targets, distances)
 
     return fake_mesh
 
 
-def create_corona(room):
+def connect_grid(graph, id_list, sources, targets, distances):
+    """
+    Adds the connections found by grid_edges to the provided graph
+    :param graph: A Graph or GraphBuilder object (a_star.py)
+    :param id_list: List of mesh point ids
+    :param sources: Array of indices into id_list of the first end of each connection
+    :param targets: Array of indices into id_list of the second end of each connection
+    :param distances: Array of distances of each connection
+    :return: None
+    """
+    if isinstance(graph, a_star.GraphBuilder):
+        ids = graph.add_nodes(id_list)
+        graph.connect_ids(ids[sources], ids[targets], distances)
+    else:
+        graph.connect_many([id_list[i] for i in sources.tolist()], [id_list[i] for i in targets.tolist()],
+                           distances.tolist())
+
+    return
+
+
+def create_corona(room, compact=False):
     """
     Creates an undirected graph for the COVID-19 algorithms in corona.py
     :param room: A room object (floor_plan.py)
-    :return: [graph] = Graph object (a_star.py)
+    :param compact: A boolean indicating whether to build a CompactGraph instead of a Graph
+    :return: [graph] = Graph or CompactGraph object (a_star.py)
+             [graph.connected] = List of connections in graph
+    """
+    return create_mesh_corona(room.get_mesh_dict(), room.get_interval(), room.chair_node_items(), compact)
+
+
+@instrument.timed('create_corona')
+def create_mesh_corona(mesh, interval, chair_list, compact=False):
+    """
+    Creates an undirected graph for the COVID-19 algorithms in corona.py from the mesh and chairs of a room, without
+    the Room object. Can run in a worker process.
+    :param mesh: Mesh object (mesh.py) of the room
+    :param interval: Interval between mesh points
+    :param chair_list: Dictionary of chair nodes of the room (see Room.chair_node_items)
+    :param compact: A boolean indicating whether to build a CompactGraph instead of a Graph
+    :return: [graph] = Graph or CompactGraph object (a_star.py)
              [graph.connected] = List of connections in graph
     """
     # Create new graph
-    graph = a_star.Graph()
+    graph = a_star.GraphBuilder() if compact else a_star.Graph()
 
     # Create mesh, chair nodes inside graph
-    make_nodes_room(graph, room)
-    chair_nodes_room(graph, room)
+    make_nodes_mesh(graph, mesh, interval)
+    connect_chairs(graph, chair_list)
 
     # Make graph undirected
+    if compact:
+        graph = graph.build()
+        return graph, graph.connections()
     graph.make_undirected()
 
     return graph, graph.connected
 
 
-def create_analysis(floor):
+@instrument.timed('create_analysis')
+def create_analysis(floor, compact=False):
     """
     Creates an undirected graph for the floor plan analysis algorithms in analysis.py.
     :param floor: A FloorPlan object (floor_plan.py)
-    :return: [graph] = Graph object
+    :param compact: A boolean indicating whether to build a CompactGraph instead of a Graph
+    :return: [graph] = Graph or CompactGraph object
              [graph.connected] = List of connections in graph
              [chair_ids] = List of chair_ids in form (room_num, "chair #")
              [door_connected] = List of door connections in form (door_id, id of connected node)
              [fake_mesh] = List of fake mesh point ids
+             [mesh] = Mesh object (mesh.py) of the floor mesh with the door and chair points added
     """
     # Create new graph
-    graph = a_star.Graph()
+    graph = a_star.GraphBuilder() if compact else a_star.Graph()
 
-    # Create mesh, door, and chair nodes inside graph
+    # Create mesh, door, and chair nodes inside graph. Door and chair points go to an overlay of the floor mesh
+    overlay = {}
     fake_mesh = make_nodes_floor(graph, floor)
-    door_connected = door_nodes(graph, floor)
-    chair_ids = chair_nodes_floor(graph, floor)
+    door_connected = door_nodes(graph, floor, overlay)
+    chair_ids = chair_nodes_floor(graph, floor, overlay)
+    mesh = floor.get_mesh_dict().with_points(overlay)
 
     # Make graph undirected
+    if compact:
+        graph = graph.build()
+        return graph, graph.connections(), chair_ids, door_connected, fake_mesh, mesh
     graph.make_undirected()
 
-    return graph, graph.connected, chair_ids, door_connected, fake_mesh
+    return graph, graph.connected, chair_ids, door_connected, fake_mesh, mesh
 
 
 def shortest_path(graph, room, start_id, goal_id, heuristics=None):
@@ -203,17 +307,19 @@ def shortest_path(graph, room, start_id, goal_id, heuristics=None):
     # Creates new heuristics if they do not exist yet.
     if heuristics is None:
         heuristics = {}
+        # Chair nodes are not part of the room mesh
+        mesh = room.get_mesh_dict().with_points({c: v[0] for c, v in room.chair_node_items().items()})
         try:
-            (goal_x, goal_y) = room.get_mesh_dict()[goal_id]
+            (goal_x, goal_y) = mesh[goal_id]
         except KeyError:
             return None
         # Creates heuristics for each connection
-        for i in room.get_id_list():
-            (grid_x, grid_y) = room.get_mesh_dict()[i]
+        for i in mesh.keys():
+            (grid_x, grid_y) = mesh[i]
             dist = math.sqrt(((goal_x - grid_x) ** 2) + ((goal_y - grid_y) ** 2))
             heuristics[i] = dist
     # Finds shortest path using a* algorithm
-    path = a_star.astar_search(graph, heuristics, start_id, goal_id)
+    path = a_star.heap_astar_search(graph, heuristics, start_id, goal_id)
 
     return path, heuristics
 
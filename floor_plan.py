@@ -1,6 +1,8 @@
 import numpy as np
 import math
 from item import Item
+from mesh import Mesh
+import instrument
 import matplotlib.pyplot as plt
 import matplotlib.path as mpltPath
 from shapely.geometry import Polygon
@@ -98,8 +100,10 @@ class Room:
         self.interval = interval
         self.items_list = items if items is not None else []
         self.poly = self.room_polygon()
-        # Dictionary of mesh coordinates and their ids
-        self.mesh_dict = self.merge_mesh() if interval is not None else []
+        self.path = mpltPath.Path(self.poly)
+        # Mesh grid of the room, and the mesh without out of bound and obstacle points built when first needed
+        self.base_mesh = self.merge_mesh() if interval is not None else Mesh()
+        self.mesh = None
 
     # Returns inner-points of the room
     def get_inner_points(self):
@@ -126,17 +130,18 @@ class Room:
     def get_type(self):
         return self.type
 
-    # Returns mesh dictionary with ids and mesh coordinate points
+    # Returns mesh (mesh.py) with ids and mesh coordinate points, without points that are out of bound or overlap
+    # with an obstacle
     def get_mesh_dict(self):
-        return self.mesh_dict
+        return self.pruned_mesh()
 
     # Returns id list of the mesh points
     def get_id_list(self):
-        return list(self.mesh_dict.keys())
+        return self.pruned_mesh().get_id_list()
 
     # Returns merged coordinate list
     def get_merged_coordinates(self):
-        return list(self.mesh_dict.values())
+        return self.pruned_mesh().get_merged_coordinates()
 
     # Returns area of the room
     def area(self):
@@ -153,24 +158,42 @@ class Room:
     def item_is_inside(self, item):
         if isinstance(item, Item):
             p = (item.x_pos(), item.z_pos())
-            path = mpltPath.Path(self.poly)
-            return path.contains_points([p])
+            return self.path.contains_points([p])
         else:
             False
 
     # Returns boolean indicating whether given point belongs inside the instance of the room
     def point_is_inside(self, x, y):
-        path = mpltPath.Path(self.poly)
-        return path.contains_points([(x, y)])
+        return self.path.contains_points([(x, y)])
+
+    # Returns boolean array indicating which of the (x, y) points in [points] are inside the room
+    def contains_points(self, points):
+        if len(points) == 0:
+            return np.zeros(0, dtype=bool)
+        return self.path.contains_points(points)
+
+    # Returns spatial index of the mesh points
+    def mesh_index(self):
+        return self.pruned_mesh().spatial_index(self.interval)
+
+    # Returns id of the mesh point that is closest to (cx, cy)
+    def find_closest_id(self, cx, cy):
+        return self.mesh_index().nearest(cx, cy)
 
     # Returns (x,y) mesh coordinate that is closest to (cx, cy)
     def find_closest(self, cx, cy):
-        return min(list(self.mesh_dict.values()), key=lambda p: (cx - p[0]) ** 2 + (cy - p[1]) ** 2)
+        return self.pruned_mesh()[self.find_closest_id(cx, cy)]
 
-    # Adds item to list of items in the instance of the room
+    # Adds item to list of items in the instance of the room. The mesh is pruned again when next needed
     def add_item(self, item):
         if self.item_is_inside(item):
-            self.items_list.append(item)
+            self.add_items([item])
+
+    # Adds items that are known to be inside the room to the list of items, without testing them again
+    def add_items(self, items):
+        if len(items):
+            self.items_list.extend(items)
+            self.mesh = None
 
     # Returns a dictionary of window items with Item object as key and (x, z) position as value
     def window_items(self):
@@ -209,17 +232,19 @@ class Room:
                 chair_num = chair_num + 1
         return chair_dict
 
-    # Returns dictionary of chair items inside the room. Hold information to create chair nodes
+    # Returns dictionary of chair items inside the room. Hold information to create chair nodes:
+    # chair coordinates, closest mesh coordinates and closest mesh id
     def chair_node_items(self):
         chair_dict = {}
         chair_num = 0
-        if self.mesh_dict is not None:
-            for i in self.items_list:
-                if i.is_chair():
-                    chair_x = i.x_pos()
-                    chair_z = i.z_pos()
-                    chair_dict["chair " + str(chair_num)] = [(chair_x, chair_z), self.find_closest(chair_x, chair_z)]
-                    chair_num = chair_num + 1
+        mesh = self.pruned_mesh()
+        for i in self.items_list:
+            if i.is_chair():
+                chair_x = i.x_pos()
+                chair_z = i.z_pos()
+                closest_id = self.find_closest_id(chair_x, chair_z)
+                chair_dict["chair " + str(chair_num)] = [(chair_x, chair_z), mesh[closest_id], closest_id]
+                chair_num = chair_num + 1
         return chair_dict
 
     # Returns min and max x, y coordinates of the room
@@ -228,24 +253,39 @@ class Room:
         xs, ys = zip(*coord)
         return max(xs), min(xs), max(ys), min(ys)
 
-    # Updates mesh grid by removing points that are out of bound or points that overlap with an obstacle.
-    # Returns a new merged grid as well as updates the id list
+    # Returns boolean array over the mesh grid points, in mesh order. A point is True if it is inside the room and
+    # does not overlap with an obstacle. Each polygon is tested once against the whole mesh.
+    @instrument.timed('update_mesh')
+    def mesh_mask(self):
+        points = self.base_mesh.xy
+        mask = self.contains_points(points)
+        for i in self.items_list:
+            if not mask.any():
+                break
+            # Only points inside the bounding box of the item need the exact test
+            (x1, y1), (x2, y2) = i.bounding_box()
+            candidates = np.flatnonzero(mask & (points[:, 0] >= x1) & (points[:, 0] <= x2) &
+                                        (points[:, 1] >= y1) & (points[:, 1] <= y2))
+            if len(candidates):
+                mask[candidates[i.contains_points(points[candidates])]] = False
+        return mask
+
+    # Returns the mesh grid without points that are out of bound or overlap with an obstacle. The mesh grid is
+    # pruned once and shared, later calls return the same Mesh
+    def pruned_mesh(self):
+        mesh = self.mesh
+        if mesh is None:
+            mesh = self.base_mesh.pruned(self.mesh_mask())
+            self.mesh = mesh
+        return mesh
+
+    # Returns ids of the mesh grid without points that are out of bound or overlap with an obstacle.
+    # Does not change the room, calling it again returns the same ids
     def update_mesh(self):
-        new_dict = self.mesh_dict.copy()
-        for id_point in new_dict.keys():
-            (x, y) = self.mesh_dict[id_point]
-            for i in self.items_list:
-                if i.point_is_inside(x, y):
-                    self.mesh_dict.pop(id_point)
-                    break
-            if not (self.point_is_inside(x, y)):
-                try:
-                    self.mesh_dict.pop(id_point)
-                except KeyError:
-                    continue
-        return self.mesh_dict.keys()
-
-    # Returns list of tuples, where each tuple represents a mesh grid point
+        return self.pruned_mesh().keys()
+
+    # Returns mesh (mesh.py) of the grid points of the room, with ids (x, y) of the grid indices
+    @instrument.timed('merge_mesh')
     def merge_mesh(self):
         x_max, x_min, y_max, y_min = self.min_max_coor()
         x_interval = int(x_max - x_min) // self.get_interval()
@@ -261,14 +301,8 @@ class Room:
             y = np.linspace(y_min + 10, y_max - 10, y_interval)
             x_mesh, y_mesh = np.meshgrid(x, y)
         if not len(x_mesh):
-            return {}
-        grid_points = {(j, i): (x_mesh[i][j], y_mesh[i][j]) for i in range(len(x_mesh)) for j in range(len(x_mesh[0]))}
-        return grid_points
-
-    # Appends a new coordinate to the merged mesh coordinates
-    def add_merged_dict(self, id_point, new_coord):
-        self.mesh_dict[id_point] = new_coord
-        return
+            return Mesh()
+        return Mesh.from_grid(x_mesh, y_mesh)
 
     # Plots single room. If plotting single room, then individual is True and plot shows
     def draw_room(self, color, individual=True):
@@ -307,7 +341,7 @@ class Room:
 
     # Plots mesh grid before updating inside a single room. Does not show plot on call.
     def draw_no_update_mesh(self):
-        for (x, y) in self.get_merged_coordinates():
+        for (x, y) in self.base_mesh.get_merged_coordinates():
             plt.plot(x, y, 'ro', markersize=1)
         plt.axis('equal')
 
@@ -318,6 +352,10 @@ class Room:
         if individual:
             plt.show()
 
+    # Returns number of mesh points and items held by the room
+    def size(self):
+        return len(self.base_mesh) + len(self.items_list)
+
     # Converts class to dictionary
     def to_dict(self):
         return {
@@ -338,8 +376,13 @@ class FloorPlan:
         self.items = item_list
         self.opening_items = []
         self.update_item_list()
-        self.mesh_dict = None
         self.interval = interval
+        # Mesh of all rooms, built when first needed
+        self.mesh = None
+
+    # Returns number of mesh points and items held by the floor plan
+    def size(self):
+        return sum([r.size() for r in self.rooms]) + len(self.items)
 
     # Returns list of corner objects that exist in the entire floor plan
     def get_corners(self):
@@ -368,47 +411,64 @@ class FloorPlan:
     def get_interval(self):
         return self.interval
 
-    # Returns mesh dictionary with ids and mesh coordinate points
+    # Returns mesh (mesh.py) with ids and mesh coordinate points of all rooms
     def get_mesh_dict(self):
-        return self.mesh_dict
+        return self.collect_mesh()
 
     # Returns id list of the mesh points
     def get_id_list(self):
-        return list(self.mesh_dict.keys())
+        return self.collect_mesh().get_id_list()
 
     # Returns merged coordinate list
     def get_merged_coordinates(self):
-        return list(self.mesh_dict.values())
+        return self.collect_mesh().get_merged_coordinates()
 
     # Updates item list for each room. If item is in certain room, the item is added to the
-    # room's item list.
+    # room's item list. The positions of all items are tested against one room polygon at a time, and each item
+    # goes to the first room that contains it.
     def update_item_list(self):
+        furniture = []
         for i in self.items:
             item_code = i.get_code()
             if item_code == 5:
                 self.opening_items.append(i)
-            elif not item_code == 2:
-                continue
-            for r in self.rooms:
-                if r.item_is_inside(i) and item_code == 2:
-                    r.add_item(i)
-                    break
+            elif item_code == 2:
+                furniture.append(i)
+        points = np.array([(i.x_pos(), i.z_pos()) for i in furniture], dtype=np.float64).reshape(-1, 2)
+        remaining = np.arange(len(furniture))
+        for r in self.rooms:
+            if len(remaining) == 0:
+                break
+            inside = r.contains_points(points[remaining])
+            r.add_items([furniture[k] for k in remaining[inside].tolist()])
+            remaining = remaining[~inside]
+
+    # Returns spatial index of the mesh points
+    def mesh_index(self):
+        return self.collect_mesh().spatial_index(self.interval)
+
+    # Returns list of ids of mesh points whose squared distance from (dx, dy) is less than [len]
+    def closest_ids(self, dx, dy, len):
+        return self.mesh_index().within(dx, dy, math.sqrt(len))
 
-    # Returns list of mesh points within a radius of 500 units from (dx, dy)
+    # Returns list of mesh points whose squared distance from (dx, dy) is less than [len]
     def closest_points(self, dx, dy, len):
-        return [p for p in self.mesh_dict.values() if ((dx - p[0]) ** 2 + (dy - p[1]) ** 2) < len]
+        mesh = self.collect_mesh()
+        return [mesh[i] for i in self.closest_ids(dx, dy, len)]
 
-    # Returns dictionary of door items inside the room. Hold information to create door nodes
+    # Returns dictionary of door items inside the room. Hold information to create door nodes:
+    # door coordinates, mesh coordinates within 500 units and their mesh ids
     def door_node_items(self):
         door_dict = {}
         door_num = 0
-        if self.mesh_dict is not None:
-            for i in self.opening_items:
-                if i.is_door():
-                    door_x = i.x_pos()
-                    door_z = i.z_pos()
-                    door_dict["door " + str(door_num)] = [(door_x, door_z), self.closest_points(door_x, door_z, 250000)]
-                    door_num = door_num + 1
+        mesh = self.collect_mesh()
+        for i in self.opening_items:
+            if i.is_door():
+                door_x = i.x_pos()
+                door_z = i.z_pos()
+                closest_ids = self.closest_ids(door_x, door_z, 250000)
+                door_dict["door " + str(door_num)] = [(door_x, door_z), [mesh[c] for c in closest_ids], closest_ids]
+                door_num = door_num + 1
         return door_dict
 
     # Returns a dictionary of window items inside the floor plan
@@ -421,23 +481,14 @@ class FloorPlan:
                 window_dict[i] = [(w_x, w_z), self.closest_points(w_x, w_z, 250000)]
         return window_dict
 
-    # Returns dictionary of the mesh coordinates of all rooms. Gives coordinates ids in the form (i, x, y)
-    # (x,y) is the original id and i changes by room
+    # Returns mesh (mesh.py) of the pruned mesh coordinates of all rooms. Gives coordinates ids in the form (i, x, y)
+    # (x,y) is the original id and i changes by room. Collected once and shared, later calls return the same Mesh
     def collect_mesh(self):
-        total_mesh = {}
-        room_num = 0
-        for r in self.rooms:
-            r.update_mesh()
-            mesh_dict = r.get_mesh_dict()
-            for i in mesh_dict.keys():
-                total_mesh[(room_num,) + i] = mesh_dict[i]
-            room_num = room_num + 1
-        self.mesh_dict = total_mesh
-        return total_mesh
-
-    # Adds a coordinate to the mesh coordinate dictionary
-    def add_merged_dict(self, id_p, coord):
-        self.mesh_dict[id_p] = coord
+        mesh = self.mesh
+        if mesh is None:
+            mesh = Mesh.concat([r.get_mesh_dict() for r in self.rooms])
+            self.mesh = mesh
+        return mesh
 
     # Draws all the window items in the floor plan
     def draw_window(self):
@@ -0,0 +1,198 @@
+from contextlib import contextmanager
+from collections import OrderedDict
+import functools
+import threading
+import time
+from constants import INSTRUMENT, TIMING_HEADER
+
+# Whether timers and counters record anything. When False they return at once
+state = {'enabled': INSTRUMENT}
+# Totals of every timer: name -> [calls, seconds, longest call in seconds]
+timers = OrderedDict()
+# Totals of every counter: name -> value
+counters = OrderedDict()
+lock = threading.Lock()
+# Timings of the request handled by the current thread
+local = threading.local()
+
+
+def enabled():
+    """
+    Returns boolean indicating whether instrumentation is on
+    :return: A boolean
+    """
+    return state['enabled']
+
+
+def set_enabled(on):
+    """
+    Turns instrumentation on or off
+    :param on: A boolean
+    :return: None
+    """
+    state['enabled'] = on
+
+
+def record(name, seconds):
+    """
+    Adds a call of [seconds] to timer [name], and to the timings of the current request
+    :param name: Name of the timer
+    :param seconds: Duration of the call
+    :return: None
+    """
+    with lock:
+        total = timers.setdefault(name, [0, 0.0, 0.0])
+        total[0] = total[0] + 1
+        total[1] = total[1] + seconds
+        total[2] = max(total[2], seconds)
+    timings = getattr(local, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timer(name):
+    """
+    Times the block of a with statement
+    :param name: Name of the timer
+    :return: Context manager
+    """
+    if not state['enabled']:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """
+    Decorator that times every call of a function
+    :param name: Name of the timer
+    :return: Decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not state['enabled']:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """
+    Adds [value] to counter [name]
+    :param name: Name of the counter
+    :param value: Number to add
+    :return: None
+    """
+    if not state['enabled']:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+def start_request():
+    """
+    Starts collecting the timings of the request handled by the current thread
+    :return: None
+    """
+    local.timings = OrderedDict()
+
+
+def finish_request():
+    """
+    Stops collecting the timings of the request handled by the current thread
+    :return: [timings] = Dictionary of timer names and seconds spent in them during the request
+    """
+    timings = getattr(local, 'timings', None)
+    local.timings = None
+    return timings if timings is not None else {}
+
+
+def timing_header(timings):
+    """
+    Formats request timings like the Server-Timing header
+    :param timings: Dictionary of timer names and seconds, see finish_request
+    :return: A string such as 'get_floor_plan;dur=12.5, create_corona;dur=3.1' in milliseconds
+    """
+    return ', '.join(['%s;dur=%.3f' % (name, seconds * 1000) for name, seconds in timings.items()])
+
+
+def reset():
+    """
+    Removes every recorded timer and counter
+    :return: None
+    """
+    with lock:
+        timers.clear()
+        counters.clear()
+
+
+def prometheus_text():
+    """
+    Returns every timer and counter in the Prometheus text format
+    :return: A string
+    """
+    with lock:
+        timer_list = [(name, list(total)) for name, total in timers.items()]
+        counter_list = list(counters.items())
+    lines = ['# HELP floorplan_stage_seconds Time spent in each stage of the analyses',
+             '# TYPE floorplan_stage_seconds summary']
+    for name, (calls, seconds, _) in timer_list:
+        lines.append('floorplan_stage_seconds_count{stage="%s"} %d' % (name, calls))
+        lines.append('floorplan_stage_seconds_sum{stage="%s"} %r' % (name, seconds))
+    lines += ['# HELP floorplan_stage_max_seconds Longest call of each stage',
+              '# TYPE floorplan_stage_max_seconds gauge']
+    for name, (_, _, longest) in timer_list:
+        lines.append('floorplan_stage_max_seconds{stage="%s"} %r' % (name, longest))
+    lines += ['# HELP floorplan_events_total Number of events counted by the analyses',
+              '# TYPE floorplan_events_total counter']
+    for name, value in counter_list:
+        lines.append('floorplan_events_total{event="%s"} %r' % (name, value))
+    return '\n'.join(lines) + '\n'
+
+
+def install(app):
+    """
+    Times every request of a Flask application as stage 'endpoint.<name>' and JSON serialization as stage
+    'serialize'. Adds the X-Timing header to the responses if TIMING_HEADER is set or the request has an X-Timing
+    header. Streamed responses are timed until their body is sent, and get no X-Timing header since it is sent
+    before the body is computed.
+    :param app: A Flask object
+    :return: None
+    """
+    from flask import request, g
+
+    # Views return dictionaries, which make_response serializes to json
+    app.make_response = timed('serialize')(app.make_response)
+
+    @app.before_request
+    def start_timing():
+        if state['enabled']:
+            start_request()
+            g.instrument_start = time.perf_counter()
+
+    @app.after_request
+    def finish_timing(response):
+        start = g.pop('instrument_start', None)
+        if start is None:
+            return response
+        name = 'endpoint.' + str(request.endpoint)
+        if response.is_streamed:
+            finish_request()
+            response.call_on_close(lambda: record(name, time.perf_counter() - start))
+            return response
+        record(name, time.perf_counter() - start)
+        timings = finish_request()
+        if TIMING_HEADER or 'X-Timing' in request.headers:
+            response.headers['X-Timing'] = timing_header(timings)
+        return response
@@ -1,150 +1,210 @@
 import numpy as np
 import matplotlib.path as mpltPath
-import math
 
+# Archi categories of each kind of item. An item belongs to the kind of its first archi category
+CHAIR_CATEGORIES = frozenset(["3BDCB55FABF94B0D", "918B3C2E26C1401E", "F15E2BBF8A7342DB", "7B4432E264464CF3",
+                              "3AC1C027F3FD430A", "81326D90BC5E4C1D", "3F877C0C80134DFC", "23833539033C4061"])
+DESK_CATEGORIES = frozenset(["E7468C0CC8FB4B63"])
+DOOR_CATEGORIES = frozenset(["1633637E83634380", "83D507B20A56479F", "AE5BFBA2DE9F439B",
+                             "FA0D229869E34AEF", "4F088FF30DF04594"])
+WINDOW_CATEGORIES = frozenset(["B8A92E293E4E4047", "7D73016B30CC43F9", "7F67F38404474A5F",
+                               "362F158D9E544F69", "D141E06C8BB441C5"])
+COLUMN_CATEGORIES = frozenset(["AF6BCC66E8014F7B"])
+
+
+# This class holds the items of a floor plan as arrays, one row per item: positions, dimensions (width, height,
+# depth), scales, y rotations and editorType codes. Footprints of all items are computed in one array operation and
+# the kind of every item is kept in boolean masks. [items] holds an Item view of every row.
+class ItemBatch:
+
+    # Initialize the class. [records] is a list of item dictionaries with keys archi_id, category, archiCategory,
+    # dimensions, position, code, rotation and scale (see api_manager.get_room_and_items)
+    def __init__(self, records):
+        n = len(records)
+        self.archi_ids = [r['archi_id'] for r in records]
+        self.categories = [r['category'] for r in records]
+        self.archi_categories = [r['archiCategory'] for r in records]
+        self.units = [r['dimensions'].get('unit') for r in records]
+        self.positions = np.array([(r['position']['x'], r['position']['y'], r['position']['z']) for r in records],
+                                  dtype=np.float64).reshape(n, 3)
+        self.dimensions = np.array([(r['dimensions']['width'], r['dimensions']['height'], r['dimensions']['depth'])
+                                    for r in records], dtype=np.float64).reshape(n, 3)
+        self.scales = np.array([(r['scale']['x'], r['scale']['y'], r['scale']['z']) for r in records],
+                               dtype=np.float64).reshape(n, 3)
+        self.rotations = np.array([r['rotation'] for r in records], dtype=np.float64).reshape(n)
+        self.codes = np.array([r['code'] // 10 for r in records], dtype=np.int64).reshape(n)
+
+        first = [c[0] if c else None for c in self.archi_categories]
+        self.chairs = np.array([c in CHAIR_CATEGORIES for c in first], dtype=bool).reshape(n)
+        self.desks = np.array([c in DESK_CATEGORIES for c in first], dtype=bool).reshape(n)
+        self.doors = np.array([c in DOOR_CATEGORIES for c in first], dtype=bool).reshape(n)
+        self.windows = np.array([c in WINDOW_CATEGORIES for c in first], dtype=bool).reshape(n)
+        self.columns = np.array([c in COLUMN_CATEGORIES for c in first], dtype=bool).reshape(n)
+
+        self.polygons = self.footprints()
+        self.items = [Item.view(self, k) for k in range(n)]
+
+    # Returns number of items in the batch
+    def __len__(self):
+        return len(self.codes)
+
+    # Returns array of shape (n, 5, 2) of the closed rotated rectangle of every item, or of the items in [rows]
+    def footprints(self, rows=slice(None)):
+        x, z = self.positions[rows, 0][:, None], self.positions[rows, 2][:, None]
+        width = np.abs(self.dimensions[rows, 0] / 2 * self.scales[rows, 0])[:, None] / 2
+        depth = np.abs(self.dimensions[rows, 2] / 2 * self.scales[rows, 2])[:, None] / 2
+        x1, x2 = x - width, x + width
+        y1, y2 = z - depth, z + depth
+        xs = np.concatenate((x1, x2, x2, x1, x1), axis=1)
+        ys = np.concatenate((y1, y1, y2, y2, y1), axis=1)
+        cos = np.cos(self.rotations[rows])[:, None]
+        sin = np.sin(self.rotations[rows])[:, None]
+        y_rot = (ys - z) * cos + (xs - x) * sin + z
+        x_rot = (xs - x) * cos - (ys - z) * sin + x
+        return np.stack((x_rot, y_rot), axis=2)
+
+    # Moves item in row [row] to position [new_pos] and updates its footprint
+    def move(self, row, new_pos):
+        self.positions[row] = new_pos
+        self.polygons[row] = self.footprints([row])[0]
+
+
+# This class is a view of one row of an ItemBatch
 class Item:
+    __slots__ = ('batch', 'row')
+
+    # Creates an item in a batch of its own
     def __init__(self, archi_id, category, archi_category, dimensions, position, code, rotation, scale):
-        self.archi_id = archi_id
-        self.category = category
-        self.archi_category = archi_category
-        self.dimensions = dimensions
-        self.position = np.array([position['x'], position['y'], position['z']])
-        self.code = code // 10
-        self.rotation = rotation
-        self.scale = np.array([scale['x'], scale['y'], scale['z']])
-        self.poly = self.item_polygon()
+        batch = ItemBatch([{'archi_id': archi_id, 'category': category, 'archiCategory': archi_category,
+                            'dimensions': dimensions, 'position': position, 'code': code, 'rotation': rotation,
+                            'scale': scale}])
+        self.batch = batch
+        self.row = 0
+
+    # Returns the Item of row [row] of [batch]
+    @classmethod
+    def view(cls, batch, row):
+        item = cls.__new__(cls)
+        item.batch = batch
+        item.row = row
+        return item
+
+    # Returns the item as a dictionary in the form ItemBatch is created from
+    def record(self):
+        (width, height, depth) = self.batch.dimensions[self.row].tolist()
+        (x, y, z) = self.batch.positions[self.row].tolist()
+        (sx, sy, sz) = self.batch.scales[self.row].tolist()
+        return {'archi_id': self.get_archi_id(), 'category': self.batch.categories[self.row],
+                'archiCategory': self.get_archi_category(),
+                'dimensions': {'width': width, 'height': height, 'depth': depth, 'unit': self.get_unit()},
+                'position': {'x': x, 'y': y, 'z': z}, 'code': self.get_code() * 10, 'rotation': self.get_rotation(),
+                'scale': {'x': sx, 'y': sy, 'z': sz}}
+
+    # Pickles the item on its own, without the rest of its batch
+    def __reduce__(self):
+        r = self.record()
+        return (Item, (r['archi_id'], r['category'], r['archiCategory'], r['dimensions'], r['position'], r['code'],
+                       r['rotation'], r['scale']))
 
     def get_archi_id(self):
-        return self.archi_id
+        return self.batch.archi_ids[self.row]
 
     # Returns width of dimensions of item.
     def get_width(self):
-        return self.dimensions['width'] / 2
+        return self.batch.dimensions[self.row, 0] / 2
 
     # Returns height of dimensions of item.
     def get_height(self):
-        return self.dimensions['height'] / 2
+        return self.batch.dimensions[self.row, 1] / 2
 
     # Returns depth of dimensions of item.
     def get_depth(self):
-        return self.dimensions['depth'] / 2
+        return self.batch.dimensions[self.row, 2] / 2
 
     # Returns unit of dimensions of item.
     def get_unit(self):
-        return self.dimensions['unit']
+        return self.batch.units[self.row]
 
     # Returns coordinates of position of item.
     def get_position(self):
-        return self.position
+        return self.batch.positions[self.row]
 
     # Returns editorType code of the item.
     def get_code(self):
-        return self.code
+        return int(self.batch.codes[self.row])
 
     # Returns archiCategory of the item
     def get_archi_category(self):
-        return self.archi_category
+        return self.batch.archi_categories[self.row]
 
     # Returns y rotation of item
     def get_rotation(self):
-        return self.rotation
+        return float(self.batch.rotations[self.row])
 
     # Returns x scale factor of item
     def get_x_scale(self):
-        return self.scale[0]
+        return self.batch.scales[self.row, 0]
 
     # Returns y scale factor of item
     def get_y_scale(self):
-        return self.scale[1]
+        return self.batch.scales[self.row, 1]
 
     # Returns z scale factor of item
     def get_z_scale(self):
-        return self.scale[2]
+        return self.batch.scales[self.row, 2]
 
     # Returns polygon array
     def get_poly(self):
-        return self.poly
+        return self.item_polygon()
 
     # Checks whether the item is a chair. Returns True if it is a chair, False if it is not.
     def is_chair(self):
-        chair_list = ["3BDCB55FABF94B0D", "918B3C2E26C1401E", "F15E2BBF8A7342DB", "7B4432E264464CF3",
-                      "3AC1C027F3FD430A", "81326D90BC5E4C1D", "3F877C0C80134DFC", "23833539033C4061"]
-        if self.archi_category is None:
-            return False
-        elif self.archi_category[0] in chair_list:
-            return True
-        return False
+        return bool(self.batch.chairs[self.row])
 
     # Checks whether the items is a desk. Returns True if it is a desk, False if it is not.
     def is_desk(self):
-        if self.archi_category is None:
-            return False
-        elif self.archi_category[0] == 'E7468C0CC8FB4B63':
-            return True
-        return False
+        return bool(self.batch.desks[self.row])
 
     # Checks whether the items is a door. Returns True if it is a door, False if it is not.
     def is_door(self):
-        door_list = ["1633637E83634380", "83D507B20A56479F", "AE5BFBA2DE9F439B",
-                     "FA0D229869E34AEF", "4F088FF30DF04594"]
-        if self.archi_category is None:
-            return False
-        elif self.archi_category[0] in door_list:
-            return True
-        return False
+        return bool(self.batch.doors[self.row])
 
     def is_column(self):
-        if self.archi_category is None:
-            return False
-        elif self.archi_category[0] == "AF6BCC66E8014F7B":
-            return True
-        return False
+        return bool(self.batch.columns[self.row])
 
     def is_window(self):
-        window_list = ["B8A92E293E4E4047", "7D73016B30CC43F9", "7F67F38404474A5F",
-                       "362F158D9E544F69", "D141E06C8BB441C5"]
-        if self.archi_category is None:
-            return False
-        elif self.archi_category[0] in window_list:
-            return True
-        return False
+        return bool(self.batch.windows[self.row])
 
     # Checks whether point (x, y) is inside the item.
     def point_is_inside(self, x, y):
-        path = mpltPath.Path(self.poly)
-        return path.contains_points([(x, y)])
+        return self.contains_points([(x, y)])
+
+    # Returns boolean array indicating which of the (x, y) points in [points] are inside the item.
+    def contains_points(self, points):
+        path = mpltPath.Path(self.batch.polygons[self.row])
+        return path.contains_points(points)
+
+    # Returns ((min x, min y), (max x, max y)) of the polygon of the item.
+    def bounding_box(self):
+        poly = self.batch.polygons[self.row]
+        return tuple(poly.min(axis=0).tolist()), tuple(poly.max(axis=0).tolist())
 
     # Returns x coordinates of item.
     def x_pos(self):
-        return self.position[0]
+        return self.batch.positions[self.row, 0]
 
     # Returns y coordinates of item.
     def y_pos(self):
-        return self.position[1]
+        return self.batch.positions[self.row, 1]
 
     # Returns z coordinates of item.
     def z_pos(self):
-        return self.position[2]
+        return self.batch.positions[self.row, 2]
 
     # Changes position of item instance. [new_pos] is a numpy array.
     def move(self, new_pos):
-        self.position = new_pos
+        self.batch.move(self.row, new_pos)
 
-    # Returns array of points that form the polygon shape of the instance of the item
+    # Returns list of (x, y) points that form the polygon shape of the instance of the item, first point repeated
     def item_polygon(self):
-        item_xpos = self.x_pos()
-        item_zpos = self.z_pos()
-        item_width = abs((self.get_width()*self.get_x_scale())) / 2
-        item_depth = abs((self.get_depth()*self.get_z_scale())) / 2
-        x1, x2 = item_xpos - item_width, item_xpos + item_width
-        y1, y2 = item_zpos - item_depth, item_zpos + item_depth
-        points = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
-        points_rot = []
-        for (x, y) in points:
-            rotation = self.get_rotation()
-            y_rot = (y - item_zpos) * math.cos(rotation) + (x - item_xpos) * math.sin(rotation) + item_zpos
-            x_rot = (x - item_xpos) * math.cos(rotation) - (y - item_zpos) * math.sin(rotation) + item_xpos
-            points_rot.append((x_rot, y_rot))
-        points_rot.append(points_rot[0])
-        return points_rot
-
+        return list(map(tuple, self.batch.polygons[self.row].tolist()))
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import api_manager
+import analysis
+import threading
+import time
+import uuid
+from constants import JOB_WORKERS, JOB_COUNT
+
+# Analyses that can run as jobs: name -> (mesh interval, function of the floor plan and a progress function)
+JOB_ANALYSES = {
+    'privacy': (450, lambda floor, progress: analysis.privacy_all(floor, progress=progress)),
+    'movement': (450, lambda floor, progress: analysis.human_movement(floor, progress=progress))
+}
+
+
+# This class represents one run of an analysis of a floor plan revision. The revision is found once the job runs.
+# [status] goes from 'queued' to 'running' to 'done' or 'failed'
+class Job:
+
+    # Initialize the class
+    def __init__(self, name, port_id):
+        self.id = uuid.uuid4().hex
+        self.analysis = name
+        self.port_id = port_id
+        self.revision = None
+        self.status = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    # Sets progress from the number of [finished] parts of the analysis out of [total]
+    def set_progress(self, finished, total):
+        self.progress = finished / total if total else 1.0
+
+    # Returns boolean indicating whether the job has stopped
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    # Converts class to dictionary. The result is only included once the job is done
+    def to_dict(self):
+        job = {'id': self.id, 'analysis': self.analysis, 'port_id': self.port_id, 'status': self.status,
+               'progress': self.progress}
+        if self.status == 'done':
+            job['result'] = self.result
+        if self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+
+# This class runs analysis jobs on a pool of [workers] threads and keeps the last [size] jobs in memory.
+# A job for an analysis of a floor plan that is queued or running is returned instead of starting another. The project
+# is fetched by the worker, and a job that finds a revision that is already done reuses its result, so finished
+# results are served again until the project changes.
+class JobQueue:
+
+    # Initialize the class
+    def __init__(self, workers=JOB_WORKERS, size=JOB_COUNT):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.size = size
+        self.jobs = OrderedDict()
+        # (name, port_id) -> id of the queued or running job
+        self.active = {}
+        # (name, port_id, revision) -> id of the done job
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    # Starts analysis [name] of the current revision of [port_id], or returns the unfinished job that already runs it
+    def submit(self, name, port_id):
+        key = (name, port_id)
+        with self.lock:
+            job = self.jobs.get(self.active.get(key))
+            if job is not None and not job.is_finished():
+                self.jobs.move_to_end(job.id)
+                return job
+            job = Job(name, port_id)
+            self.jobs[job.id] = job
+            self.active[key] = job.id
+            self.evict()
+        self.executor.submit(self.run, job)
+        return job
+
+    # Runs [job] in a worker thread. A project that cannot be fetched fails the job
+    def run(self, job):
+        job.status = 'running'
+        try:
+            interval, function = JOB_ANALYSES[job.analysis]
+            pinned = api_manager.pinned_project(job.port_id)
+            job.revision = pinned[1]
+            key = (job.analysis, job.port_id, job.revision)
+            with self.lock:
+                done = self.jobs.get(self.keys.get(key))
+            if done is not None:
+                job.result = done.result
+            else:
+                floor = api_manager.load_floor_plan(job.port_id, interval, pinned)
+                job.result = function(floor, job.set_progress)
+            job.progress = 1.0
+            job.status = 'done'
+            with self.lock:
+                self.keys[key] = job.id
+        except Exception as e:
+            job.error = repr(e)
+            job.status = 'failed'
+        job.finished_at = time.time()
+        with self.lock:
+            if self.active.get((job.analysis, job.port_id)) == job.id:
+                del self.active[(job.analysis, job.port_id)]
+
+    # Returns the job with id [job_id], or None
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    # Removes the oldest finished jobs while more than [size] jobs are kept. Unfinished jobs are never removed
+    def evict(self):
+        for job in list(self.jobs.values()):
+            if len(self.jobs) <= self.size:
+                break
+            if job.is_finished():
+                del self.jobs[job.id]
+                if self.keys.get((job.analysis, job.port_id, job.revision)) == job.id:
+                    del self.keys[(job.analysis, job.port_id, job.revision)]
+
+
+# Job queue shared by every request of this process
+job_queue = JobQueue()
@@ -0,0 +1,176 @@
+from collections.abc import Mapping
+from spatial_index import GridIndex
+import numpy as np
+
+
+def grid_number(value):
+    """
+    Returns value as an int if it is a whole number, or None. Ids of mesh points are compared like dictionary keys,
+    so 2.0 is the same id as 2.
+    :param value: Part of a mesh id
+    :return: An int or None
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return int(value)
+    return None
+
+
+# This class represents an immutable mesh, a mapping of mesh point ids to (x, y) coordinates.
+# The mesh grid is held in contiguous arrays: [ij] the (x, y) grid indices of every point, [xy] the coordinates,
+# [room] the room number of every point and [valid] a mask that removes pruned points. The mesh of a single room has
+# no room column and ids (x, y), the mesh of a floor plan has ids (room, x, y). The row of an id is computed from the
+# grid [shapes] (first row, width, height) of each room. Auxiliary points (doors, chairs, fake points) are kept in an
+# [overlay] dictionary and come after the grid points.
+# Methods that change the mesh return a new Mesh sharing the unchanged arrays, so a single mesh can be used by any
+# number of analyses and threads.
+class Mesh(Mapping):
+
+    # Initialize the class. The arrays must not be changed after they are given to the mesh
+    def __init__(self, ij=None, xy=None, room=None, valid=None, shapes=None, overlay=None):
+        self.ij = ij if ij is not None else np.zeros((0, 2), dtype=np.int32)
+        self.xy = xy if xy is not None else np.zeros((0, 2), dtype=np.float64)
+        self.room = room
+        self.valid = valid if valid is not None else np.ones(len(self.ij), dtype=bool)
+        self.shapes = shapes if shapes is not None else np.zeros((0, 3), dtype=np.int64)
+        self.overlay = overlay if overlay is not None else {}
+        for a in (self.ij, self.xy, self.room, self.valid, self.shapes):
+            if a is not None:
+                a.flags.writeable = False
+        # Lists of ids and coordinates, and spatial index, built when first needed
+        self.ids = None
+        self.coords = None
+        self.index = None
+
+    # Creates the mesh of a single room from the (height, width) coordinate arrays of np.meshgrid
+    @classmethod
+    def from_grid(cls, x_mesh, y_mesh):
+        x_mesh = np.asarray(x_mesh, dtype=np.float64)
+        y_mesh = np.asarray(y_mesh, dtype=np.float64)
+        height, width = x_mesh.shape
+        i, j = np.indices((height, width), dtype=np.int32)
+        ij = np.column_stack((j.ravel(), i.ravel()))
+        xy = np.column_stack((x_mesh.ravel(), y_mesh.ravel()))
+        return cls(ij, xy, shapes=np.array([[0, width, height]], dtype=np.int64))
+
+    # Creates the mesh of a floor plan from the meshes of its rooms. Room i gets ids (i, x, y). Overlays are left out
+    @classmethod
+    def concat(cls, meshes):
+        if len(meshes) == 0:
+            return cls(room=np.zeros(0, dtype=np.int32))
+        shapes = []
+        start = 0
+        for m in meshes:
+            (width, height) = (int(m.shapes[0][1]), int(m.shapes[0][2])) if len(m.shapes) else (0, 0)
+            shapes.append((start, width, height))
+            start = start + len(m.ij)
+        ij = np.concatenate([m.ij for m in meshes])
+        xy = np.concatenate([m.xy for m in meshes])
+        valid = np.concatenate([m.valid for m in meshes])
+        room = np.repeat(np.arange(len(meshes), dtype=np.int32), [len(m.ij) for m in meshes])
+        return cls(ij, xy, room, valid, np.array(shapes, dtype=np.int64))
+
+    # Returns grid row of mesh id [key], or None if the key is not a grid point of the mesh
+    def row(self, key):
+        if not isinstance(key, tuple) or len(key) != (2 if self.room is None else 3):
+            return None
+        (r, j, i) = (0,) + key if self.room is None else key
+        (r, j, i) = (grid_number(r), grid_number(j), grid_number(i))
+        if r is None or j is None or i is None or not 0 <= r < len(self.shapes):
+            return None
+        (start, width, height) = self.shapes[r].tolist()
+        if not (0 <= j < width and 0 <= i < height):
+            return None
+        row = start + i * width + j
+        return row if self.valid[row] else None
+
+    # Returns array of the rows of the grid points that are not pruned
+    def rows(self):
+        return np.flatnonzero(self.valid)
+
+    # Returns array of shape (n, 2) of the coordinates of the grid points that are not pruned
+    def grid_coordinates(self):
+        return self.xy[self.valid]
+
+    def __getitem__(self, key):
+        if key in self.overlay:
+            return self.overlay[key]
+        row = self.row(key)
+        if row is None:
+            raise KeyError(key)
+        return tuple(self.xy[row].tolist())
+
+    def __iter__(self):
+        return iter(self.get_id_list())
+
+    def __len__(self):
+        return int(np.count_nonzero(self.valid)) + len(self.overlay)
+
+    def __contains__(self, key):
+        return key in self.overlay or self.row(key) is not None
+
+    # Returns list of the coordinates, in the order of the ids
+    def values(self):
+        return self.get_merged_coordinates()
+
+    # Returns list of (id, coordinates) pairs
+    def items(self):
+        return list(zip(self.get_id_list(), self.get_merged_coordinates()))
+
+    # Returns a new mesh without the grid points that are False in [mask], a boolean array over the grid rows
+    def pruned(self, mask):
+        return Mesh(self.ij, self.xy, self.room, self.valid & np.asarray(mask, dtype=bool), self.shapes, self.overlay)
+
+    # Returns a new mesh with the points of dictionary [points] added to the overlay
+    def with_points(self, points):
+        overlay = dict(self.overlay)
+        overlay.update(points)
+        return Mesh(self.ij, self.xy, self.room, self.valid, self.shapes, overlay)
+
+    # Returns a new mesh with the grid points only
+    def grid(self):
+        return Mesh(self.ij, self.xy, self.room, self.valid, self.shapes)
+
+    # Returns id list of the mesh points: grid points in grid order, then overlay points. The list is shared
+    # and must not be changed
+    def get_id_list(self):
+        if self.ids is None:
+            rows = self.rows()
+            if self.room is None:
+                ids = self.ij[rows].tolist()
+            else:
+                ids = np.column_stack((self.room[rows], self.ij[rows])).tolist()
+            self.ids = list(map(tuple, ids)) + list(self.overlay.keys())
+        return self.ids
+
+    # Returns list of the (x, y) coordinates of the mesh points, in the order of the ids. The list is shared
+    # and must not be changed
+    def get_merged_coordinates(self):
+        if self.coords is None:
+            self.coords = list(map(tuple, self.grid_coordinates().tolist())) + list(self.overlay.values())
+        return self.coords
+
+    # Returns spatial index of the mesh points with cells of size [cell]
+    def spatial_index(self, cell=None):
+        if self.index is None:
+            coords = self.grid_coordinates()
+            if self.overlay:
+                coords = np.concatenate((coords, np.array(list(self.overlay.values()), dtype=np.float64)))
+            self.index = GridIndex(self.get_id_list(), coords, cell)
+        return self.index
+
+    # Returns number of bytes held by the arrays of the mesh
+    def nbytes(self):
+        return sum([a.nbytes for a in (self.ij, self.xy, self.room, self.valid, self.shapes) if a is not None])
+
+    # Pickles the arrays and overlay only, the cached lists and index are rebuilt when needed
+    def __getstate__(self):
+        return {'ij': self.ij, 'xy': self.xy, 'room': self.room, 'valid': self.valid, 'shapes': self.shapes,
+                'overlay': self.overlay}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ids = None
+        self.coords = None
+        self.index = None
@@ -0,0 +1,60 @@
+from concurrent.futures import ProcessPoolExecutor
+import threading
+from constants import WORKERS
+
+# Process pools by number of workers. Kept alive between requests so workers are only started once
+executors = {}
+lock = threading.Lock()
+
+
+def get_executor(workers):
+    """
+    Returns the process pool with the given number of workers, creating it on first use.
+    :param workers: Number of worker processes
+    :return: A ProcessPoolExecutor object
+    """
+    with lock:
+        if workers not in executors:
+            executors[workers] = ProcessPoolExecutor(max_workers=workers)
+        return executors[workers]
+
+
+def map_rooms(func, payloads, workers=WORKERS, progress=None):
+    """
+    Calls func on every payload, fanning the calls out across a process pool if more than one worker is requested.
+    func must be a module level function and payloads must be picklable.
+    :param func: Function taking a single payload
+    :param payloads: List of payloads, one per room or group of rooms
+    :param workers: Number of worker processes. None or 1 runs the calls in this process
+    :param progress: Function called with (finished, total) number of payloads whenever a payload is finished
+    :return: [results] = List of the results of func, in the order of payloads
+    """
+    if workers is None or workers <= 1 or len(payloads) <= 1:
+        results = map(func, payloads)
+    else:
+        results = get_executor(workers).map(func, payloads)
+    if progress is None:
+        return list(results)
+    finished = []
+    for r in results:
+        finished.append(r)
+        progress(len(finished), len(payloads))
+    return finished
+
+
+def split(items, parts):
+    """
+    Splits a list into at most [parts] contiguous chunks of similar size.
+    :param items: List to split
+    :param parts: Number of chunks
+    :return: [chunks] = List of lists
+    """
+    parts = max(1, min(parts or 1, len(items)))
+    size, extra = divmod(len(items), parts)
+    chunks = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+import threading
+import hashlib
+import json
+import time
+import os
+
+# Keys of the project json that change whenever the project is edited, in order of preference
+REVISION_KEYS = ('revision', 'updatedAt', 'updated_at', 'version')
+
+
+def project_revision(project):
+    """
+    Returns the revision of a project, or None if the project json has no revision information.
+    :param project: Dictionary of project json
+    :return: The revision value or update timestamp of the project
+    """
+    for k in REVISION_KEYS:
+        if project.get(k) is not None:
+            return project[k]
+    return None
+
+
+# This class caches fetched project json by port id, in memory and optionally on disk.
+# Entries are used without refetching for [ttl] seconds. After that the project is fetched again, and if its
+# revision did not change the existing entry is kept, so anything keyed by the revision stays valid.
+class PlanCache:
+    def __init__(self, fetch, size=32, ttl=300, directory=None, clock=time.time):
+        self.fetch = fetch
+        self.size = size
+        self.ttl = ttl
+        self.directory = directory
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the project json of [port_id]. If [revision] is given and differs from the cached revision, the
+    # cached entry is replaced
+    def get(self, port_id, revision=None):
+        return self.get_entry(port_id, revision)['project']
+
+    # Returns the revision of the cached project json of [port_id], fetching it if needed
+    def get_revision(self, port_id):
+        return self.get_entry(port_id)['revision']
+
+    # Returns cache entry {'project', 'revision', 'fetched_at'} of [port_id]
+    def get_entry(self, port_id, revision=None):
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(port_id)
+            if entry is not None:
+                self.entries.move_to_end(port_id)
+        if entry is None:
+            entry = self.load(port_id)
+        if entry is not None and self.is_fresh(entry, now, revision):
+            with self.lock:
+                self.hits = self.hits + 1
+            self.store(port_id, entry, False)
+            return entry
+
+        with self.lock:
+            self.misses = self.misses + 1
+        project = self.fetch(port_id)
+        new_entry = {'project': project, 'revision': project_revision(project), 'fetched_at': now}
+        if entry is not None and entry['revision'] is not None and entry['revision'] == new_entry['revision']:
+            # Same revision, keep the existing entry and only renew its time
+            entry['fetched_at'] = now
+            new_entry = entry
+        self.store(port_id, new_entry, True)
+        return new_entry
+
+    # Returns boolean indicating whether a cache entry can be used without refetching
+    def is_fresh(self, entry, now, revision=None):
+        if revision is not None and entry['revision'] != revision:
+            return False
+        return now - entry['fetched_at'] < self.ttl
+
+    # Adds an entry to the memory cache, evicting the least recently used entries, and writes it to disk
+    def store(self, port_id, entry, write):
+        with self.lock:
+            self.entries[port_id] = entry
+            self.entries.move_to_end(port_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        if write and self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.file_path(port_id)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(entry, f)
+            os.replace(path + '.tmp', path)
+
+    # Returns the cache entry of [port_id] stored on disk, or None
+    def load(self, port_id):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.file_path(port_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # Returns path of the file that stores [port_id] on disk
+    def file_path(self, port_id):
+        return os.path.join(self.directory, hashlib.sha1(port_id.encode('utf-8')).hexdigest() + '.json')
+
+    # Removes [port_id] from the cache
+    def invalidate(self, port_id):
+        with self.lock:
+            self.entries.pop(port_id, None)
+        if self.directory is not None:
+            try:
+                os.remove(self.file_path(port_id))
+            except OSError:
+                pass
+
+    # Removes every project from the memory cache
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# This class caches constructed FloorPlan objects by (port_id, interval, revision). The total size of the cached
+# floor plans (mesh points and items, see FloorPlan.size) is kept under [max_size] by evicting the least recently used.
+# Analyses do not change floor plans (meshes are immutable, see mesh.py), so callers share the cached floor plans.
+class FloorCache:
+    def __init__(self, build, max_size=500000):
+        self.build = build
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.total = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the floor plan of [port_id] with mesh [interval] at [revision], building it from [project] if needed.
+    # [project] must be the project json of [revision], so a floor plan is never stored under another revision
+    def get(self, port_id, interval, revision, project):
+        key = (port_id, interval, revision)
+        with self.lock:
+            floor = self.entries.get(key)
+            if floor is not None:
+                self.entries.move_to_end(key)
+                self.hits = self.hits + 1
+            else:
+                self.misses = self.misses + 1
+        if floor is None:
+            floor = self.build(project, interval)
+            self.store(key, floor)
+        return floor
+
+    # Adds a floor plan to the cache, evicting the least recently used floor plans
+    def store(self, key, floor):
+        size = floor.size()
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total = self.total - old.size()
+            self.entries[key] = floor
+            self.total = self.total + size
+            while self.total > self.max_size and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total = self.total - evicted.size()
+
+    # Removes every floor plan of [port_id] from the cache
+    def invalidate(self, port_id):
+        with self.lock:
+            for key in [k for k in self.entries.keys() if k[0] == port_id]:
+                self.total = self.total - self.entries.pop(key).size()
+
+    # Removes every floor plan from the cache
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total = 0
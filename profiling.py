@@ -0,0 +1,155 @@
+from collections import OrderedDict, Counter
+import threading
+import functools
+import cProfile
+import pstats
+import json
+import time
+import uuid
+import sys
+import os
+from constants import PROFILING, PROFILE_TOP, PROFILE_INTERVAL, PROFILE_COUNT, PROFILE_DIR
+
+# Finished profiles by id, the oldest are removed first
+profiles = OrderedDict()
+lock = threading.Lock()
+# Only one cProfile profiler can be active in a process, other requests are only sampled meanwhile
+cprofile_lock = threading.Lock()
+
+
+# This class is a thread that samples the Python stack of another thread every [interval] seconds and counts the
+# stacks it sees, root first
+class StackSampler(threading.Thread):
+
+    # Initialize the class
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        threading.Thread.__init__(self, daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    # Stops sampling and returns the stacks in the collapsed format of flamegraph.pl, one 'stack count' per line
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return ''.join(['%s %d\n' % (stack, n) for stack, n in self.stacks.most_common()])
+
+
+def top_functions(profile, n=PROFILE_TOP):
+    """
+    Returns the functions that took the most time in a cProfile profile, not counting the functions they called
+    :param profile: A cProfile.Profile object
+    :param n: Number of functions to return
+    :return: [functions] = List of dictionaries with the function, number of calls, own and cumulative seconds
+    """
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda s: s[1][2], reverse=True)[:n]
+    return [{'function': '%s:%d(%s)' % (os.path.basename(f), line, name), 'calls': nc, 'seconds': tt,
+             'cumulative_seconds': ct} for (f, line, name), (cc, nc, tt, ct, callers) in rows]
+
+
+# This class profiles one request, with cProfile when no other request holds it and with a stack sampler
+class RequestProfile:
+
+    # Initialize the class and start profiling the current thread
+    def __init__(self, path):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.start = time.perf_counter()
+        self.profile = None
+        if cprofile_lock.acquire(blocking=False):
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Another profiling tool is active
+                self.profile = None
+                cprofile_lock.release()
+        self.sampler = StackSampler(threading.get_ident())
+        self.sampler.start()
+
+    # Stops profiling and returns dictionary of the profile
+    def stop(self):
+        top = None
+        if self.profile is not None:
+            self.profile.disable()
+            cprofile_lock.release()
+            top = top_functions(self.profile)
+        collapsed = self.sampler.stop()
+        return {'id': self.id, 'path': self.path, 'seconds': time.perf_counter() - self.start, 'top': top,
+                'samples': sum(self.sampler.stacks.values()), 'collapsed': collapsed}
+
+
+def store(result):
+    """
+    Keeps a finished profile in memory, and writes it to PROFILE_DIR if set: <id>.json with the top functions and
+    <id>.collapsed with the sampled stacks
+    :param result: Dictionary of a profile, see RequestProfile.stop
+    :return: None
+    """
+    with lock:
+        profiles[result['id']] = result
+        while len(profiles) > PROFILE_COUNT:
+            profiles.popitem(last=False)
+    if PROFILE_DIR is not None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, result['id'])
+        with open(path + '.json', 'w') as f:
+            json.dump({k: v for k, v in result.items() if k != 'collapsed'}, f)
+        with open(path + '.collapsed', 'w') as f:
+            f.write(result['collapsed'])
+
+
+def get_profile(profile_id):
+    """
+    Finds a finished profile
+    :param profile_id: A string that represents the profile
+    :return: Dictionary of the profile, or None
+    """
+    with lock:
+        return profiles.get(profile_id)
+
+
+def install(app):
+    """
+    Profiles the requests of a Flask application that ask for it with a 'profile' query parameter or an X-Profile
+    header, if PROFILING is set. The response gets an X-Profile-Id header with the id of the stored profile.
+    Profiling stops when the request fails too, and streamed responses are profiled until their body is sent.
+    :param app: A Flask object
+    :return: None
+    """
+    from flask import request
+
+    # Wraps the whole dispatch of the request rather than before_request and after_request, which are skipped when
+    # the view raises, so the profiler is always stopped on the thread that started it
+    dispatch = app.full_dispatch_request
+
+    @functools.wraps(dispatch)
+    def profiled_dispatch():
+        if not PROFILING or (request.args.get('profile') is None and 'X-Profile' not in request.headers):
+            return dispatch()
+        request_profile = RequestProfile(request.full_path)
+        try:
+            response = dispatch()
+        except BaseException:
+            store(request_profile.stop())
+            raise
+        response.headers['X-Profile-Id'] = request_profile.id
+        if response.is_streamed:
+            response.call_on_close(lambda: store(request_profile.stop()))
+        else:
+            store(request_profile.stop())
+        return response
+    app.full_dispatch_request = profiled_dispatch
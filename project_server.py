@@ -0,0 +1,54 @@
+from flask import Flask
+import api_manager
+import synthetic
+import argparse
+import json
+import time
+import os
+
+# Stand-in for the Archisketch project API serving recorded projects. Point ARCHISKETCH_API_URL at
+# http://<host>:<port>/v1/public/projects/ to run the analysis service against it
+project_server = Flask(__name__)
+settings = {'directory': '.', 'latency': 0.0, 'synthetic': False}
+
+
+@project_server.route('/v1/public/projects/<port_id>/detail')
+def get_project(port_id):
+    try:
+        project = api_manager.load_project(port_id, settings['directory'], settings['latency'])
+    except (OSError, ValueError):
+        project = synthetic_port_project(port_id) if settings['synthetic'] else None
+    if project is None:
+        return json.dumps({'status': 'FAILED', 'message': 'The project is not recorded'}), 404
+    return {'project': project}
+
+
+def synthetic_port_project(port_id):
+    """
+    Creates the synthetic project (synthetic.py) of a port id in the form 'synthetic-<seed>'
+    :param port_id: A string that represents Archi id of floor plan
+    :return: [project] = json of project, or None if the port id is not of a synthetic project
+    """
+    seed = port_id[len('synthetic-'):]
+    if not port_id.startswith('synthetic-') or not seed.isdigit():
+        return None
+    time.sleep(settings['latency'])
+    return synthetic.synthetic_project(int(seed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves recorded projects in the form of the Archisketch API')
+    parser.add_argument('--directory', default='projects', help='Directory of the recorded projects')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each response is delayed')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--synthetic', action='store_true',
+                        help='Serve the synthetic project of the seed to port ids synthetic-<seed> that are not recorded')
+    parser.add_argument('--record', nargs='*', default=[],
+                        help='Port ids to fetch from the Archisketch API into the directory before serving')
+    args = parser.parse_args()
+    for port_id in args.record:
+        print('Recorded', api_manager.record_project(port_id, args.directory))
+    settings['directory'] = os.path.abspath(args.directory)
+    settings['latency'] = args.latency
+    settings['synthetic'] = args.synthetic
+    project_server.run(host='0.0.0.0', port=args.port, threaded=True)
@@ -0,0 +1,384 @@
+from collections import OrderedDict
+from create_graph import GRID_DIRECTIONS
+from floor_plan import FloorPlan
+from item import ItemBatch
+import threading
+import corona
+import bisect
+import heapq
+import copy
+import math
+import uuid
+import numpy as np
+from constants import *
+
+
+# This class keeps the pruned mesh, the sanitizer distances and the closest mesh points of the chairs of one room up
+# to date while the items of the room change. Every mesh grid point counts the items covering it, so adding or
+# removing an item only tests the grid points inside the bounding box of the item.
+# The graph of the room is not stored: the neighbors of a grid point are found from the grid, so blocking or freeing
+# a point is all it takes to remove or add its edges. Shortest path distances from the sanitizer are repaired around
+# the changed points instead of searching the whole room again.
+class RoomState:
+
+    # Initialize the class
+    def __init__(self, room):
+        self.room = room
+        mesh = room.base_mesh
+        self.xy = mesh.xy
+        (self.width, self.height) = (int(mesh.shapes[0][1]), int(mesh.shapes[0][2])) if len(mesh.shapes) else (0, 0)
+        # x coordinates of the grid columns and y coordinates of the grid rows, both increasing
+        self.xs = self.xy[:self.width, 0]
+        self.ys = self.xy[::self.width, 1] if self.width else np.zeros(0)
+        self.inside = room.contains_points(self.xy)
+        self.covered = np.zeros(len(self.xy), dtype=np.int32)
+        for i in room.items_list:
+            self.covered[self.footprint_rows(i)] += 1
+        self.valid = self.inside & (self.covered == 0)
+        self.open = self.valid.tolist()
+        self.valid_rows = np.flatnonzero(self.valid)
+        interval = room.get_interval()
+        self.steps = []
+        for (dx, dy, f) in GRID_DIRECTIONS:
+            self.steps += [(dx, dy, float(interval * f)), (-dx, -dy, float(interval * f))]
+        # Closest mesh row and squared distance of every chair, by item
+        self.closest = {}
+        # Grid rows freed since the closest points were last checked
+        self.opened = np.zeros(0, dtype=np.int64)
+        self.result = None
+        self.search()
+        room.mesh = mesh.pruned(self.valid)
+
+    # Returns array of the grid rows covered by [item]. Same test as Room.mesh_mask
+    def footprint_rows(self, item):
+        if self.width == 0:
+            return np.zeros(0, dtype=np.int64)
+        (x1, y1), (x2, y2) = item.bounding_box()
+        j1, j2 = np.searchsorted(self.xs, x1, 'left'), np.searchsorted(self.xs, x2, 'right')
+        i1, i2 = np.searchsorted(self.ys, y1, 'left'), np.searchsorted(self.ys, y2, 'right')
+        if j1 >= j2 or i1 >= i2:
+            return np.zeros(0, dtype=np.int64)
+        rows = (np.arange(i1, i2)[:, None] * self.width + np.arange(j1, j2)[None, :]).ravel()
+        return rows[item.contains_points(self.xy[rows])]
+
+    # Adds [item] to the items covering the mesh
+    def add(self, item):
+        self.covered[self.footprint_rows(item)] += 1
+        self.result = None
+
+    # Removes [item] from the items covering the mesh. Must be called before the item is moved
+    def remove(self, item):
+        self.covered[self.footprint_rows(item)] -= 1
+        self.closest.pop(id(item), None)
+        self.result = None
+
+    # Yields (row, distance) of the open grid points next to grid row [r]
+    def neighbors(self, r):
+        (i, j) = divmod(r, self.width)
+        for (dx, dy, dist) in self.steps:
+            (jj, ii) = (j + dx, i + dy)
+            if 0 <= jj < self.width and 0 <= ii < self.height:
+                n = ii * self.width + jj
+                if self.open[n]:
+                    yield n, dist
+
+    # Dijkstra search from every row in [open_heap] of (distance, row), lowering the distances of their neighbors
+    def relax(self, open_heap):
+        (dist, pred) = (self.dist, self.pred)
+        heapq.heapify(open_heap)
+        while open_heap:
+            g, r = heapq.heappop(open_heap)
+            if g > dist[r]:
+                continue
+            for n, d in self.neighbors(r):
+                neighbor_g = g + d
+                if neighbor_g < dist[n]:
+                    dist[n] = neighbor_g
+                    pred[n] = r
+                    heapq.heappush(open_heap, (neighbor_g, n))
+
+    # Finds the distance of every mesh point from the sanitizer, which stands on the first mesh point
+    def search(self):
+        self.dist = [math.inf] * len(self.xy)
+        self.pred = [-1] * len(self.xy)
+        self.source = int(self.valid_rows[0]) if len(self.valid_rows) else None
+        if self.source is not None:
+            self.dist[self.source] = 0
+            self.relax([(0, self.source)])
+
+    # Repairs the distances after the grid rows [closed] were blocked and the grid rows [opened] were freed
+    def repair(self, closed, opened):
+        (dist, pred) = (self.dist, self.pred)
+        # Every point whose shortest path went through a blocked point has to be reached again
+        children = {}
+        for r, p in enumerate(pred):
+            if p >= 0:
+                children.setdefault(p, []).append(r)
+        lost = []
+        stack = list(closed)
+        while stack:
+            r = stack.pop()
+            lost.append(r)
+            stack.extend(children.pop(r, []))
+        for r in lost:
+            dist[r] = math.inf
+            pred[r] = -1
+        # Lost and freed points start from their best reached neighbor
+        open_heap = []
+        for r in lost + list(opened):
+            if not self.open[r]:
+                continue
+            for n, d in self.neighbors(r):
+                if dist[n] + d < dist[r]:
+                    dist[r] = dist[n] + d
+                    pred[r] = n
+            if dist[r] < math.inf:
+                open_heap.append((dist[r], r))
+        self.relax(open_heap)
+
+    # Applies the changes of the covering items to the mesh, the distances and the closest points of the chairs
+    def refresh(self):
+        valid = self.inside & (self.covered == 0)
+        closed = np.flatnonzero(self.valid & ~valid).tolist()
+        opened = np.flatnonzero(valid & ~self.valid).tolist()
+        if len(closed) == 0 and len(opened) == 0:
+            return
+        self.valid = valid
+        self.valid_rows = np.flatnonzero(valid)
+        for r in closed:
+            self.open[r] = False
+        for r in opened:
+            self.open[r] = True
+        first = int(self.valid_rows[0]) if len(self.valid_rows) else None
+        if first != self.source:
+            self.search()
+        else:
+            self.repair(closed, opened)
+
+        # A chair keeps its closest point unless the point was blocked or a freed point is at least as close
+        for key, (row, _) in list(self.closest.items()):
+            if not self.open[row]:
+                del self.closest[key]
+        self.opened = np.union1d(self.opened, opened).astype(np.int64)
+        self.room.mesh = self.room.base_mesh.pruned(valid)
+        self.result = None
+
+    # Returns (row, squared distance) of the mesh point closest to chair [item]. Ties go to the first row, as in
+    # GridIndex.nearest
+    def closest_row(self, item):
+        (x, y) = (item.x_pos(), item.z_pos())
+        cached = self.closest.get(id(item))
+        if cached is not None and len(self.opened):
+            d = ((self.xy[self.opened] - (x, y)) ** 2).sum(axis=1)
+            k = np.lexsort((self.opened, d))[0]
+            if d[k] < cached[1] or (d[k] == cached[1] and self.opened[k] < cached[0]):
+                cached = None
+        if cached is None:
+            d = ((self.xy[self.valid_rows] - (x, y)) ** 2).sum(axis=1)
+            k = int(np.argmin(d))
+            cached = (int(self.valid_rows[k]), d[k])
+            self.closest[id(item)] = cached
+        return cached
+
+    # Returns array of the sanitizer score of every chair in [chairs], see corona.sanitize
+    def sanitize_column(self, chairs):
+        if len(chairs) == 0 or len(self.valid_rows) == 0:
+            return np.full(len(chairs), np.nan)
+        column = np.zeros(len(chairs))
+        for k, c in enumerate(chairs):
+            (row, _) = self.closest_row(c)
+            (x, y) = (c.x_pos(), c.z_pos())
+            closest = self.xy[row].tolist()
+            path_length = self.dist[row] + math.sqrt((x - closest[0]) ** 2 + (y - closest[1]) ** 2)
+            if path_length < SANITIZE_FIRST:
+                column[k] = 0
+            elif path_length < SANITIZE_SECOND:
+                column[k] = 0.5
+            elif path_length < math.inf:
+                column[k] = 1
+        return column
+
+    # Returns (chairs, matrix) of the room, see corona.metric_matrix. Rebuilt only after the room changed
+    def metric_matrix(self):
+        if self.result is None:
+            self.refresh()
+            chairs = list(self.room.chair_items().values())
+            self.result = corona.metric_matrix(self.room, self.sanitize_column(chairs))
+            self.opened = np.zeros(0, dtype=np.int64)
+        return self.result
+
+
+# This class is an editing session of a floor plan. It holds a private copy of the floor plan and its items, and
+# keeps the COVID-19 scores of every room up to date while items are moved, added and removed. Only the rooms an
+# edit touches are scored again.
+class AnalysisSession:
+
+    # Initialize the class with a copy of [floor]. The floor plan given is not changed
+    def __init__(self, floor):
+        rooms = []
+        for r in floor.rooms:
+            room = copy.copy(r)
+            room.items_list = []
+            room.mesh = None
+            rooms.append(room)
+        items = ItemBatch([i.record() for i in floor.items]).items
+        self.floor = FloorPlan(floor.corners, floor.walls, rooms, floor.interval, items)
+        self.states = [RoomState(r) for r in rooms]
+        self.items = {}
+        # Position of every item in the item list of the floor plan, which orders the items of the rooms
+        self.rank = {}
+        self.room_of = {}
+        for k, i in enumerate(items):
+            self.items[i.get_archi_id()] = i
+            self.rank[id(i)] = k
+        for n, r in enumerate(rooms):
+            for i in r.items_list:
+                self.room_of[id(i)] = n
+        self.lock = threading.Lock()
+
+    # Returns number of the first room that the position of [item] is inside, or None
+    def find_room(self, item):
+        point = np.array([(item.x_pos(), item.z_pos())], dtype=np.float64)
+        for n, r in enumerate(self.floor.rooms):
+            if r.contains_points(point)[0]:
+                return n
+        return None
+
+    # Puts furniture [item] into the room it is inside
+    def place(self, item):
+        n = self.find_room(item)
+        if n is None:
+            return
+        room = self.floor.rooms[n]
+        ranks = [self.rank[id(i)] for i in room.items_list]
+        room.items_list.insert(bisect.bisect(ranks, self.rank[id(item)]), item)
+        self.states[n].add(item)
+        self.room_of[id(item)] = n
+
+    # Takes furniture [item] out of its room
+    def take(self, item):
+        n = self.room_of.pop(id(item), None)
+        if n is None:
+            return
+        self.floor.rooms[n].items_list.remove(item)
+        self.states[n].remove(item)
+
+    # Moves item [archi_id] to (x, z), keeping its height
+    def move_item(self, archi_id, x, z):
+        item = self.items[archi_id]
+        self.take(item)
+        item.move(np.array([x, item.y_pos(), z], dtype=np.float64))
+        if item.get_code() == 2:
+            self.place(item)
+        self.floor.mesh = None
+
+    # Adds item from dictionary [record] (see ItemBatch)
+    def add_item(self, record):
+        item = ItemBatch([record]).items[0]
+        if item.get_archi_id() in self.items:
+            self.remove_item(item.get_archi_id())
+        self.items[item.get_archi_id()] = item
+        self.rank[id(item)] = len(self.rank)
+        self.floor.items.append(item)
+        if item.get_code() == 5:
+            self.floor.opening_items.append(item)
+        elif item.get_code() == 2:
+            self.place(item)
+        self.floor.mesh = None
+
+    # Removes item [archi_id]
+    def remove_item(self, archi_id):
+        item = self.items.pop(archi_id)
+        self.take(item)
+        self.floor.items.remove(item)
+        if item in self.floor.opening_items:
+            self.floor.opening_items.remove(item)
+        self.floor.mesh = None
+
+    # Returns the list of [edits] with numeric positions, or raises ValueError naming the first invalid edit. Checks
+    # the whole list against the items the earlier edits leave, so that an invalid list changes nothing
+    def check(self, edits):
+        if not isinstance(edits, list):
+            raise ValueError('The edits are not a list')
+        archi_ids = set(self.items)
+        checked = []
+        for e in edits:
+            if not isinstance(e, dict):
+                raise ValueError('The edit is not a JSON object: ' + str(e))
+            op = e.get('op')
+            if op == 'add':
+                try:
+                    archi_id = ItemBatch([e['item']]).items[0].get_archi_id()
+                except (ValueError, KeyError, TypeError, AttributeError, IndexError):
+                    raise ValueError('The item to add is not valid: ' + str(e.get('item')))
+                archi_ids.add(archi_id)
+                checked.append({'op': op, 'item': e['item']})
+            elif op in ('move', 'remove'):
+                archi_id = e.get('archi_id')
+                if archi_id not in archi_ids:
+                    raise ValueError('Unknown item ' + str(archi_id))
+                if op == 'remove':
+                    archi_ids.discard(archi_id)
+                    checked.append({'op': op, 'archi_id': archi_id})
+                    continue
+                try:
+                    (x, z) = (float(e['x']), float(e['z']))
+                except (KeyError, TypeError, ValueError):
+                    x = z = math.nan
+                if not (math.isfinite(x) and math.isfinite(z)):
+                    raise ValueError('The position of item %s is not a number' % archi_id)
+                checked.append({'op': op, 'archi_id': archi_id, 'x': x, 'z': z})
+            else:
+                raise ValueError('Unknown edit ' + str(op))
+        return checked
+
+    # Applies a list of edits {'op': 'move', 'archi_id', 'x', 'z'}, {'op': 'add', 'item'} or
+    # {'op': 'remove', 'archi_id'}. Items to add are dictionaries in the form ItemBatch is created from.
+    # Raises ValueError without changing the session if any edit is invalid, see check
+    def apply(self, edits):
+        with self.lock:
+            for e in self.check(edits):
+                if e['op'] == 'move':
+                    self.move_item(e['archi_id'], e['x'], e['z'])
+                elif e['op'] == 'add':
+                    self.add_item(e['item'])
+                elif e['op'] == 'remove':
+                    self.remove_item(e['archi_id'])
+
+    # Returns the COVID-19 scores of the floor plan, same as corona.score_all
+    def score(self):
+        with self.lock:
+            return corona.score_rooms([s.metric_matrix() for s in self.states])
+
+
+# Open sessions by session id, the least recently used are closed first
+sessions = OrderedDict()
+sessions_lock = threading.Lock()
+
+
+def open_session(floor):
+    """
+    Opens an editing session of a floor plan
+    :param floor: A FloorPlan object (floor_plan.py)
+    :return: [session_id] = A string that represents the session
+    """
+    session = AnalysisSession(floor)
+    session_id = uuid.uuid4().hex
+    with sessions_lock:
+        sessions[session_id] = session
+        while len(sessions) > SESSION_COUNT:
+            sessions.popitem(last=False)
+    return session_id
+
+
+def get_session(session_id):
+    """
+    Finds an open editing session
+    :param session_id: A string that represents the session
+    :return: An AnalysisSession object, or None if there is no such session
+    """
+    with sessions_lock:
+        session = sessions.get(session_id)
+        if session is not None:
+            sessions.move_to_end(session_id)
+    return session
@@ -0,0 +1,118 @@
+import numpy as np
+import math
+
+
+# This class represent a uniform grid spatial index over a set of 2D points.
+# Points are bucketed into square cells and stored sorted by cell, so the points of a row of cells are
+# a contiguous slice of the sorted arrays.
+class GridIndex:
+
+    # Initialize the class. [ids] is a list of point ids and [coords] the (x, y) coordinates of each point
+    def __init__(self, ids, coords, cell=None):
+        self.ids = list(ids)
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if len(self.coords) == 0:
+            self.cell = 1.0
+            self.origin = np.zeros(2)
+            self.width, self.height = 0, 0
+            self.order = np.zeros(0, dtype=np.int64)
+            self.cell_start = np.zeros(1, dtype=np.int64)
+            return
+        self.origin = self.coords.min(axis=0)
+        extent = self.coords.max(axis=0) - self.origin
+        if cell is None:
+            # Around one point per cell on average
+            cell = math.sqrt(max(extent[0] * extent[1], 1.0) / len(self.coords))
+        self.cell = float(max(cell, 1e-9))
+        cells = np.floor((self.coords - self.origin) / self.cell).astype(np.int64)
+        self.width, self.height = int(cells[:, 0].max()) + 1, int(cells[:, 1].max()) + 1
+        linear = cells[:, 1] * self.width + cells[:, 0]
+        # Stable sort keeps the original order of points inside each cell
+        self.order = np.argsort(linear, kind='stable')
+        self.cell_start = np.zeros(self.width * self.height + 1, dtype=np.int64)
+        np.cumsum(np.bincount(linear, minlength=self.width * self.height), out=self.cell_start[1:])
+
+    # Returns number of points in the index
+    def __len__(self):
+        return len(self.ids)
+
+    # Returns (x, y) cell coordinates of point (x, y). May be outside of the grid
+    def cell_of(self, x, y):
+        return int(math.floor((x - self.origin[0]) / self.cell)), int(math.floor((y - self.origin[1]) / self.cell))
+
+    # Returns sorted row numbers of the points inside the block of cells from (x1, y1) to (x2, y2), inclusive
+    def block_rows(self, x1, y1, x2, y2):
+        x1, y1 = max(x1, 0), max(y1, 0)
+        x2, y2 = min(x2, self.width - 1), min(y2, self.height - 1)
+        if x1 > x2 or y1 > y2:
+            return np.zeros(0, dtype=np.int64)
+        rows = [self.order[self.cell_start[y * self.width + x1]:self.cell_start[y * self.width + x2 + 1]]
+                for y in range(y1, y2 + 1)]
+        return np.sort(np.concatenate(rows))
+
+    # Returns row number of the point closest to (x, y). Ties go to the point that was added first
+    def nearest_row(self, x, y):
+        if len(self.ids) == 0:
+            return None
+        cx, cy = self.cell_of(x, y)
+        # Rings closer than the grid itself are empty
+        r = max(0, -cx, -cy, cx - self.width + 1, cy - self.height + 1)
+        r_max = r + max(self.width, self.height)
+        best, best_d = None, math.inf
+        while r <= r_max:
+            rows = self.block_rows(cx - r, cy - r, cx + r, cy + r)
+            if len(rows):
+                d = ((self.coords[rows] - (x, y)) ** 2).sum(axis=1)
+                k = int(np.argmin(d))
+                best, best_d = int(rows[k]), float(d[k])
+            # Points in rings further out are at least r cells away
+            if best is not None and best_d < (r * self.cell) ** 2:
+                break
+            r = r + 1
+        return best
+
+    # Returns id of the point closest to (x, y)
+    def nearest(self, x, y):
+        row = self.nearest_row(x, y)
+        return None if row is None else self.ids[row]
+
+    # Returns row numbers of points closer than [radius] to (x, y), in the order the points were added
+    def within_rows(self, x, y, radius):
+        if len(self.ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        x1, y1 = self.cell_of(x - radius, y - radius)
+        x2, y2 = self.cell_of(x + radius, y + radius)
+        rows = self.block_rows(x1, y1, x2, y2)
+        d = ((self.coords[rows] - (x, y)) ** 2).sum(axis=1)
+        return rows[d < radius ** 2]
+
+    # Returns list of ids of points closer than [radius] to (x, y), in the order the points were added
+    def within(self, x, y, radius):
+        return [self.ids[i] for i in self.within_rows(x, y, radius).tolist()]
+
+    # Returns arrays (first, second) of row numbers of every pair of points with first < second whose distance is at
+    # most [radius], sorted by first then second. Distances are computed as sqrt(dx ** 2 + dy ** 2)
+    def pairs_within(self, radius):
+        if len(self.ids) < 2:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        reach = int(math.floor(radius / self.cell)) + 1
+        cells = np.floor((self.coords - self.origin) / self.cell).astype(np.int64)
+        first, second = [], []
+        for dy in range(-reach, reach + 1):
+            for dx in range(-reach, reach + 1):
+                cx, cy = cells[:, 0] + dx, cells[:, 1] + dy
+                p = np.flatnonzero((cx >= 0) & (cx < self.width) & (cy >= 0) & (cy < self.height))
+                linear = cy[p] * self.width + cx[p]
+                start = self.cell_start[linear]
+                count = self.cell_start[linear + 1] - start
+                # Every point p paired with every point of the cell at offset (dx, dy) from its own cell
+                p = np.repeat(p, count)
+                q = self.order[np.repeat(start - np.cumsum(count) + count, count) + np.arange(count.sum())]
+                keep = p < q
+                first.append(p[keep])
+                second.append(q[keep])
+        first, second = np.concatenate(first), np.concatenate(second)
+        dist = np.sqrt(((self.coords[first] - self.coords[second]) ** 2).sum(axis=1))
+        first, second = first[dist <= radius], second[dist <= radius]
+        order = np.lexsort((second, first))
+        return first[order], second[order]
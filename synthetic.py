@@ -0,0 +1,149 @@
+from item import CHAIR_CATEGORIES, DESK_CATEGORIES, DOOR_CATEGORIES, WINDOW_CATEGORIES, COLUMN_CATEGORIES
+import argparse
+import random
+import math
+import json
+
+# Categories sorted so that the same seed picks the same categories in every process
+CHAIRS = sorted(CHAIR_CATEGORIES)
+DESKS = sorted(DESK_CATEGORIES)
+DOORS = sorted(DOOR_CATEGORIES)
+WINDOWS = sorted(WINDOW_CATEGORIES)
+COLUMNS = sorted(COLUMN_CATEGORIES)
+WALL_HEIGHT = 2400
+WALL_THICKNESS = 100
+
+
+def item_json(archi_id, category, x, z, width, depth, code, rotation=0.0, height=800):
+    """
+    Creates the json of an item in the form of the Archisketch API
+    :param archi_id: A string that represents Archi id of the item
+    :param category: Archi category of the item
+    :param x: x coordinate of the item
+    :param z: z coordinate of the item
+    :param width: Width of the item
+    :param depth: Depth of the item
+    :param code: editorType code of the item, 20 for furniture and 50 for doors and windows
+    :param rotation: y rotation of the item in radians
+    :param height: Height of the item
+    :return: [item] = Dictionary of item json
+    """
+    return {'archiId': archi_id,
+            'meta': {'categories': None,
+                     'archiCategories': [category],
+                     'dimensions': {'width': width, 'height': height, 'depth': depth, 'unit': 'mm'},
+                     'editorType': {'code': code}},
+            'position': {'x': x, 'y': 0, 'z': z},
+            'rotation': {'x': 0, 'y': rotation, 'z': 0},
+            'scale': {'x': 1, 'y': 1, 'z': 1}}
+
+
+def synthetic_project(seed=0, columns=2, rows=2, room_width=9000, room_depth=7000, desks=4, chairs_per_desk=2,
+                      room_columns=1, rogue_walls=1):
+    """
+    Creates the json of a project with one floor plan of [columns] x [rows] rectangular rooms, in the form of the
+    Archisketch API. Neighboring rooms are joined by doors and every room on the outside has a window. Every room
+    has rows of desks with chairs on both sides, columns and rogue walls. Every fourth room is a meeting room.
+    The same arguments always give the same project.
+    :param seed: Seed of the random positions and categories
+    :param columns: Number of rooms along x
+    :param rows: Number of rooms along z
+    :param room_width: Width of each room
+    :param room_depth: Depth of each room
+    :param desks: Number of desks in each room
+    :param chairs_per_desk: Number of chairs at each desk
+    :param room_columns: Number of columns in each room
+    :param rogue_walls: Number of walls inside each room that do not belong to a room
+    :return: [project] = Dictionary of project json
+    """
+    rnd = random.Random(seed)
+    corners = []
+    walls = []
+    rooms = []
+    items = []
+    half = WALL_THICKNESS / 2
+
+    # Corners on the grid lines, shared by the neighboring rooms
+    for r in range(rows + 1):
+        for c in range(columns + 1):
+            corners.append({'archiId': 'corner-%d-%d' % (c, r),
+                            'position': {'x': c * room_width, 'y': 0, 'z': r * room_depth}})
+    for r in range(rows + 1):
+        for c in range(columns):
+            walls.append({'corners': ['corner-%d-%d' % (c, r), 'corner-%d-%d' % (c + 1, r)],
+                          'height': WALL_HEIGHT, 'thickness': WALL_THICKNESS})
+    for c in range(columns + 1):
+        for r in range(rows):
+            walls.append({'corners': ['corner-%d-%d' % (c, r), 'corner-%d-%d' % (c, r + 1)],
+                          'height': WALL_HEIGHT, 'thickness': WALL_THICKNESS})
+
+    for r in range(rows):
+        for c in range(columns):
+            n = r * columns + c
+            (x0, z0) = (c * room_width, r * room_depth)
+            (x1, z1) = (x0 + room_width, z0 + room_depth)
+            inner = [(x0 + half, z0 + half), (x1 - half, z0 + half), (x1 - half, z1 - half), (x0 + half, z1 - half)]
+            rooms.append({'corners': ['corner-%d-%d' % (c, r), 'corner-%d-%d' % (c + 1, r),
+                                      'corner-%d-%d' % (c + 1, r + 1), 'corner-%d-%d' % (c, r + 1)],
+                          'innerPoints': [{'x': x, 'y': 0, 'z': z} for (x, z) in inner],
+                          'height': WALL_HEIGHT,
+                          'label': 'Room %d' % n,
+                          'type': 26 if n % 4 == 3 else 1})
+
+            # Doors to the next room along x and along z, a window on the outside walls
+            if c + 1 < columns:
+                items.append(item_json('door-%d-x' % n, rnd.choice(DOORS), x1, z0 + room_depth / 2, 900,
+                                       WALL_THICKNESS, 50, math.pi / 2, 2100))
+            if r + 1 < rows:
+                items.append(item_json('door-%d-z' % n, rnd.choice(DOORS), x0 + room_width / 2, z1, 900,
+                                       WALL_THICKNESS, 50, 0.0, 2100))
+            if r == 0:
+                items.append(item_json('window-%d' % n, rnd.choice(WINDOWS), x0 + room_width / 2, z0, 1200,
+                                       WALL_THICKNESS, 50, 0.0, 1200))
+            elif c == 0:
+                items.append(item_json('window-%d' % n, rnd.choice(WINDOWS), x0, z0 + room_depth / 2, 1200,
+                                       WALL_THICKNESS, 50, math.pi / 2, 1200))
+
+            # Desks in rows across the first half of the room, chairs in front of and behind them
+            per_row = max(1, int(math.ceil(math.sqrt(desks))))
+            for d in range(desks):
+                (i, j) = divmod(d, per_row)
+                dx = x0 + room_width * (j + 1) / (per_row + 1) / 2 + rnd.uniform(-100, 100)
+                dz = z0 + room_depth * (i + 1) / (per_row + 1) + rnd.uniform(-100, 100)
+                items.append(item_json('desk-%d-%d' % (n, d), rnd.choice(DESKS), dx, dz, 1400, 700, 20))
+                per_side = (chairs_per_desk + 1) // 2
+                for k in range(chairs_per_desk):
+                    side = 1 if k % 2 == 0 else -1
+                    offset = (k // 2 - (per_side - 1) / 2) * 600
+                    rotation = rnd.uniform(-0.3, 0.3) + (math.pi if side < 0 else 0.0)
+                    items.append(item_json('chair-%d-%d-%d' % (n, d, k), rnd.choice(CHAIRS), dx + offset,
+                                           dz + side * 650, 500, 500, 20, rotation))
+
+            # Columns and rogue walls in the second half of the room
+            for k in range(room_columns):
+                (x, z) = (x0 + rnd.uniform(0.55, 0.9) * room_width, z0 + rnd.uniform(0.2, 0.8) * room_depth)
+                items.append(item_json('column-%d-%d' % (n, k), rnd.choice(COLUMNS), x, z, 600, 600, 20, 0.0,
+                                       WALL_HEIGHT))
+            for k in range(rogue_walls):
+                start = (x0 + rnd.uniform(0.55, 0.8) * room_width, z0 + rnd.uniform(0.2, 0.8) * room_depth)
+                end = (start[0] + rnd.uniform(800, 1600), start[1])
+                for (e, (x, z)) in enumerate((start, end)):
+                    corners.append({'archiId': 'rogue-%d-%d-%d' % (n, k, e), 'position': {'x': x, 'y': 0, 'z': z}})
+                walls.append({'corners': ['rogue-%d-%d-0' % (n, k), 'rogue-%d-%d-1' % (n, k)],
+                              'height': WALL_HEIGHT, 'thickness': WALL_THICKNESS})
+
+    return {'archiId': 'synthetic-%d' % seed,
+            'revision': 'synthetic-%d-%d-%d-%d-%d' % (seed, columns, rows, desks, chairs_per_desk),
+            'floorplans': [{'corners': corners, 'walls': walls, 'rooms': rooms, 'items': items}]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Writes the json of a synthetic project to standard output')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--columns', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=2)
+    parser.add_argument('--desks', type=int, default=4)
+    parser.add_argument('--chairs', type=int, default=2, help='Chairs per desk')
+    args = parser.parse_args()
+    print(json.dumps(synthetic_project(args.seed, args.columns, args.rows, desks=args.desks,
+                                       chairs_per_desk=args.chairs)))
@@ -0,0 +1,271 @@
+import matplotlib.path as mpltPath
+import numpy as np
+
+# Angles closer than this are treated as the same sweep event
+ANGLE_EPS = 1e-12
+# Points closer than this are treated as the same polygon vertex
+POINT_EPS = 1e-6
+# Points and sight lines closer than this to a segment or a segment end are decided by the view polygon test
+EDGE_EPS = 1e-4
+
+
+def view_segments(room_polygon, obstacles):
+    """
+    Collects the segments that block vision inside a room. Segments that cross each other are split at the crossing,
+    so that no two segments cross (see visibility_polygon).
+    :param room_polygon: List of (x, y) coordinates of the corners of the room
+    :param obstacles: List of obstacles, where each obstacle is a list of (x, y) corners of a closed shape. A rogue
+            wall is an obstacle with two corners
+    :return: [segments] = Array of shape (n, 2, 2) with the two end points of every segment
+    """
+    segments = []
+    for shape in [room_polygon] + list(obstacles):
+        shape = [tuple(c) for c in shape]
+        if len(shape) == 2:
+            segments.append(shape)
+            continue
+        for i in range(len(shape)):
+            segments.append([shape[i], shape[(i + 1) % len(shape)]])
+    segments = np.array(segments, dtype=np.float64).reshape(-1, 2, 2)
+    # Zero length segments block nothing
+    segments = segments[np.any(segments[:, 0] != segments[:, 1], axis=1)]
+    return split_crossings(segments)
+
+
+def cross(a, b):
+    """
+    Returns the z component of the cross product of arrays of 2D vectors
+    :param a: Array of shape (..., 2)
+    :param b: Array of shape (..., 2)
+    :return: Array of shape (...)
+    """
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def split_crossings(segments):
+    """
+    Splits segments at the points where they properly cross other segments. Segments that only touch are kept whole.
+    :param segments: Array of shape (n, 2, 2) of segments
+    :return: [segments] = Array of shape (m, 2, 2) of segments that do not cross each other
+    """
+    a, b = segments[:, 0], segments[:, 1]
+    edge = b - a
+    # Orientation of the ends of every segment j against the line of every segment i, shape (n, n)
+    o1 = cross(edge[:, None, :], a[None, :, :] - a[:, None, :])
+    o2 = cross(edge[:, None, :], b[None, :, :] - a[:, None, :])
+    crossing = (np.sign(o1) * np.sign(o2) < 0) & (np.sign(o1.T) * np.sign(o2.T) < 0)
+    if not crossing.any():
+        return segments
+    split = []
+    for i in range(len(segments)):
+        others = np.flatnonzero(crossing[i])
+        if len(others) == 0:
+            split.append(segments[i])
+            continue
+        # Parameter of the crossing points along segment i
+        t = np.sort(cross(a[others] - a[i], edge[others]) / cross(edge[i][None, :], edge[others]))
+        ends = a[i] + np.concatenate(([0.0], t, [1.0]))[:, None] * edge[i]
+        split += [ends[k:k + 2] for k in range(len(ends) - 1) if np.any(ends[k] != ends[k + 1])]
+    return np.array(split, dtype=np.float64).reshape(-1, 2, 2)
+
+
+def visibility_polygon(x, y, segments):
+    """
+    Finds the exact visibility polygon (isovist) of view point (x, y) with a rotational sweep over the segment
+    end points. The end point angles are sorted once, and the sweep keeps the segments crossing the view ray in a list
+    ordered by distance, inserting and removing a segment at its end point angles with a binary search. Between two
+    consecutive end point angles the closest segment does not change, so every corner of the polygon is an exact
+    ray-segment intersection. O(n log n) comparisons for n segments that do not cross each other (see view_segments).
+    :param x: x coordinate of view point
+    :param y: y coordinate of view point
+    :param segments: Array of shape (n, 2, 2) of the segments that block vision (see view_segments)
+    :return: [view_list] - list of (x, y) coordinates of the corners of the view polygon in counterclockwise order
+    """
+    a = segments[:, 0] - (x, y)
+    b = segments[:, 1] - (x, y)
+    turn = cross(a, b)
+
+    # Segments pointing at the view point have no angular width. Orient the others counterclockwise
+    keep = np.abs(turn) > ANGLE_EPS * np.maximum(1.0, (a ** 2).sum(axis=1) * (b ** 2).sum(axis=1))
+    a, b, turn = a[keep], b[keep], turn[keep]
+    flip = turn < 0
+    a[flip], b[flip] = b[flip].copy(), a[flip].copy()
+    if len(a) == 0:
+        return []
+    start = np.mod(np.arctan2(a[:, 1], a[:, 0]), 2 * np.pi)
+    span = np.mod(np.arctan2(b[:, 1], b[:, 0]) - start, 2 * np.pi)
+
+    # Sorted event angles and the middle of the angular interval that follows each event
+    events = np.sort(np.concatenate((start, np.mod(start + span, 2 * np.pi))))
+    events = events[np.concatenate(([True], np.diff(events) > ANGLE_EPS))]
+    following = np.concatenate((events[1:], [events[0] + 2 * np.pi]))
+    middle = (events + following) / 2
+    n = len(events)
+
+    # Interval in which every segment starts and the interval after its last one. Segments with both in the same
+    # interval are narrower than ANGLE_EPS
+    first_k = (np.searchsorted(events, start, 'right') - 1).tolist()
+    end_k = (np.searchsorted(events, np.mod(start + span, 2 * np.pi), 'right') - 1).tolist()
+    starts = [[] for _ in range(n)]
+    ends = [[] for _ in range(n)]
+    wrapping = []
+    for s in range(len(a)):
+        if first_k[s] == end_k[s]:
+            continue
+        starts[first_k[s]].append(s)
+        ends[end_k[s]].append(s)
+        if end_k[s] < first_k[s]:
+            # Crosses the ray at angle 0, so it is already active when the sweep starts
+            wrapping.append(s)
+
+    # Distance from the view point to segment s along the middle ray of interval k
+    edge = b - a
+    numerator = cross(a, edge).tolist()
+    (ex, ey) = (edge[:, 0].tolist(), edge[:, 1].tolist())
+    (cos, sin) = (np.cos(middle).tolist(), np.sin(middle).tolist())
+
+    def depth(s, k):
+        return numerator[s] / (cos[k] * ey[s] - sin[k] * ex[s])
+
+    # Segments do not cross, so their order along the ray stays the same while they are both active.
+    # Ties go to the lower segment index
+    def insert(s, k):
+        d = depth(s, k)
+        (lo, hi) = (0, len(active))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            dm = depth(active[mid], k)
+            if dm < d or (dm == d and active[mid] < s):
+                lo = mid + 1
+            else:
+                hi = mid
+        active.insert(lo, s)
+
+    active = []
+    for s in wrapping:
+        insert(s, n - 1)
+    closest = np.zeros(n, dtype=np.int64)
+    visible = np.zeros(n, dtype=bool)
+    for k in range(n):
+        for s in ends[k]:
+            active.remove(s)
+        for s in starts[k]:
+            insert(s, k)
+        if active:
+            closest[k] = active[0]
+            visible[k] = True
+
+    # Corners where the closest segment meets the rays at both ends of every interval
+    def hit(angles):
+        d = np.stack((np.cos(angles), np.sin(angles)), axis=1)
+        t = cross(a[closest], edge[closest]) / cross(d, edge[closest])
+        return d * t[:, None] + (x, y)
+
+    first, last = hit(events), hit(following)
+    view_list = []
+    for k in range(n):
+        if not visible[k]:
+            continue
+        # Corners in the middle of a straight run along the same segment are left out
+        if closest[k] != closest[k - 1] or not visible[k - 1]:
+            view_list.append(tuple(first[k].tolist()))
+        if closest[k] != closest[(k + 1) % n] or not visible[(k + 1) % n]:
+            view_list.append(tuple(last[k].tolist()))
+
+    # Remove repeated corners
+    unique = []
+    for p in view_list:
+        if not unique or abs(p[0] - unique[-1][0]) > POINT_EPS or abs(p[1] - unique[-1][1]) > POINT_EPS:
+            unique.append(p)
+    if len(unique) > 1 and abs(unique[0][0] - unique[-1][0]) <= POINT_EPS and \
+            abs(unique[0][1] - unique[-1][1]) <= POINT_EPS:
+        unique.pop()
+    return unique
+
+
+def polygon_contains(x, y, segments, points):
+    """
+    Tests which points are inside the view polygon of view point (x, y), the same test as matplotlib's
+    Path.contains_point on the polygon of visibility_polygon
+    :param x: x coordinate of view point
+    :param y: y coordinate of view point
+    :param segments: Array of shape (n, 2, 2) of the segments that block vision (see view_segments)
+    :param points: Array of shape (m, 2) of the points to test
+    :return: [inside] - Boolean array of shape (m,)
+    """
+    view_list = visibility_polygon(x, y, segments)
+    if len(view_list) < 3:
+        return np.zeros(len(points), dtype=bool)
+    path = mpltPath.Path(view_list)
+    return np.array([path.contains_point(q) for q in points], dtype=bool)
+
+
+def visibility_counts(points, segments, budget=2000000):
+    """
+    Counts how many of the points can see each point: the number of points whose view polygon (see visibility_polygon)
+    contains it. Segment pq is tested against every segment with orientation tests instead. Point pairs whose
+    tests all clear zero by more than EDGE_EPS are decided by them: blocked if pq crosses a segment, visible
+    otherwise, which is symmetric, so only pairs p < q are tested. The other pairs, such as sight lines grazing a
+    segment end and points on a segment, are decided with the view polygon and Path.contains_point in both directions,
+    as the reference. Pairs are tested in blocks of rows sized so that about [budget] pair-segment tests are held in
+    memory at once.
+    :param points: Array of shape (n, 2) of the (x, y) coordinates of the points
+    :param segments: Array of shape (m, 2, 2) of the segments that block vision (see view_segments)
+    :param budget: Number of pair-segment tests computed in one block
+    :return: [counts] - Integer array of shape (n,)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    counts = np.ones(n, dtype=np.int64)
+    if n == 0 or len(segments) == 0:
+        counts[:] = n
+        return counts
+    a, b = segments[:, 0], segments[:, 1]
+
+    # Per point terms of the orientation tests, shape (n, m): side of every segment each point is on, 0 when closer
+    # than EDGE_EPS to its line, and cross products of the points with the segment ends
+    length = np.sqrt(((b - a) ** 2).sum(axis=1))
+    distance = cross((b - a)[None, :, :], points[:, None, :] - a[None, :, :]) / length[None, :]
+    side = (np.sign(distance) * (np.abs(distance) > EDGE_EPS)).astype(np.int8)
+    cross_a = cross(points[:, None, :], a[None, :, :])
+    cross_b = cross(points[:, None, :], b[None, :, :])
+
+    # Pairs (p, q) with p < q that the orientation tests cannot decide
+    unsure = []
+    rows = max(1, budget // (n * len(segments)))
+    for r0 in range(0, n - 1, rows):
+        r1 = min(r0 + rows, n - 1)
+        p = slice(r0, r1)
+        q = slice(r0 + 1, n)
+        # Sides of the line of segment ab that p and q are on: 1 same side, -1 opposite sides, 0 undecided
+        straddle = side[p, None, :] * side[None, q, :]
+        # Sides of the line pq that a and b are on: cross(q - p, a - p) and cross(q - p, b - p). Divided by the
+        # length of pq they are the distances of a and b from the line
+        pq = cross(points[p, None, :], points[None, q, :])[:, :, None]
+        tol = EDGE_EPS * np.sqrt(((points[None, q, :] - points[p, None, :]) ** 2).sum(axis=2))[:, :, None]
+        o3 = cross_a[None, q, :] - cross_a[p, None, :] + pq
+        o4 = cross_b[None, q, :] - cross_b[p, None, :] + pq
+        ends = (np.sign(o3) * (np.abs(o3) > tol)) * (np.sign(o4) * (np.abs(o4) > tol))
+        blocked = np.any((straddle < 0) & (ends < 0), axis=2)
+        undecided = ~blocked & np.any((straddle <= 0) & (ends <= 0), axis=2)
+        # Keep the pairs p < q only
+        upper = np.arange(r0, r1)[:, None] < np.arange(r0 + 1, n)[None, :]
+        seen = ~blocked & ~undecided & upper
+        counts[r0:r1] += seen.sum(axis=1)
+        counts[r0 + 1:] += seen.sum(axis=0)
+        (i, j) = np.nonzero(undecided & upper)
+        unsure.append(np.stack((i + r0, j + r0 + 1), axis=1))
+
+    # Points on the line of a segment may be on the boundary of their own view polygon
+    on_edge = np.flatnonzero(np.any(side == 0, axis=1))
+    counts[on_edge] -= 1
+    # (viewer, viewed) pairs to test with the view polygon of the viewer, grouped by viewer
+    unsure = np.concatenate(unsure) if len(unsure) else np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate((unsure, unsure[:, ::-1], np.stack((on_edge, on_edge), axis=1)))
+    pairs = pairs[np.argsort(pairs[:, 0], kind='stable')]
+    viewers, first = np.unique(pairs[:, 0], return_index=True)
+    for k, (v, f) in enumerate(zip(viewers.tolist(), first.tolist())):
+        viewed = pairs[f:first[k + 1] if k + 1 < len(first) else len(pairs), 1]
+        inside = polygon_contains(points[v, 0], points[v, 1], segments, points[viewed])
+        np.add.at(counts, viewed[inside], 1)
+    return counts